@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# CLIP图像编码推理后端基准测试（每个后端在独立子进程中运行，互不影响内存统计）
+# 用法：python bench_clip.py                             # 测试全部后端
+#      python bench_clip.py --backends eager int8 --batch-size 16 --rounds 20
+# 输出：加载耗时、单批延迟p50/p95、吞吐（张/秒）、进程峰值内存、相对fp32的余弦偏差
+
+
+def run_worker(backend: str, batch_size: int, rounds: int) -> dict:
+    """子进程：加载指定后端并测量"""
+    os.environ["CLIP_BACKEND"] = backend
+    import numpy as np
+    import torch
+    from utils import image_utils
+    from utils.clip_backends import verify_encoder
+
+    start = time.perf_counter()
+    model, _ = image_utils.load_clip()
+    load_seconds = time.perf_counter() - start
+
+    batch = torch.randn((batch_size, 3, 224, 224), generator=torch.Generator().manual_seed(1))
+    image_utils.clip_encoder(batch)  # 预热一次，不计入延迟
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        image_utils.clip_encoder(batch)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies)
+
+    return {
+        "backend": backend,
+        "load_s": round(load_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 1),
+        "images_per_s": round(batch_size / float(np.median(latencies)), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        **verify_encoder(model, image_utils.clip_encoder, image_utils.device)
+    }
+
+
+if __name__ == "__main__":
+    from utils.clip_backends import CLIP_BACKENDS
+
+    parser = argparse.ArgumentParser(description="对比CLIP图像编码各推理后端的延迟/内存/精度")
+    parser.add_argument("--backends", nargs="*", default=list(CLIP_BACKENDS), help="要测试的后端")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("CLIP_BATCH_SIZE", 16)), help="单批图片数")
+    parser.add_argument("--rounds", type=int, default=10, help="计时轮数")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.batch_size, args.rounds)))
+        sys.exit(0)
+
+    columns = ["backend", "load_s", "p50_ms", "p95_ms", "images_per_s", "peak_rss_mb", "min_cosine", "max_drift"]
+    print("".join(f"{col:>14}" for col in columns))
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", backend,
+             "--batch-size", str(args.batch_size), "--rounds", str(args.rounds)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if proc.returncode != 0:
+            print(f"{backend:>14}  失败: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print("".join(f"{str(result[col]):>14}" for col in columns))
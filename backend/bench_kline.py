@@ -0,0 +1,73 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from stock.kline_generator import kline_generator
+
+# K线图渲染基准测试：对比 mplfinance 完整构建 与 模板渲染（fast）的每秒出图数
+# 用法：python bench_kline.py                 # 使用随机行情
+#      python bench_kline.py --charts 100 --ts-code sh.600000   # 使用本地日线
+#      python bench_kline.py --save ./bench_out                 # 同时保存两种渲染结果便于目视对比
+
+
+def random_bars(n: int = 120, seed: int = 0) -> pd.DataFrame:
+    """生成随机日线（几何布朗运动）"""
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    return pd.DataFrame({
+        "trade_date": pd.bdate_range("2024-01-01", periods=n),
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n)),
+        "low": np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n)),
+        "close": close,
+        "vol": rng.uniform(1e5, 5e5, n)
+    })
+
+
+def bench(render, frames: list) -> tuple:
+    """
+    逐张渲染并计时（首张单独计时，作为冷启动开销）
+    :return: (首张耗时秒, 后续每秒出图数)
+    """
+    start = time.perf_counter()
+    render(frames[0])
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for df in frames[1:]:
+        render(df)
+    elapsed = time.perf_counter() - start
+    return first, (len(frames) - 1) / elapsed if elapsed > 0 else float("inf")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比K线图渲染方式的吞吐")
+    parser.add_argument("--charts", type=int, default=50, help="每种方式渲染的图片数")
+    parser.add_argument("--ts-code", help="使用本地日线（默认随机行情）")
+    parser.add_argument("--save", help="保存两种渲染结果的目录")
+    args = parser.parse_args()
+
+    if args.ts_code:
+        from stock.bar_store import bar_store
+        base = bar_store.read(args.ts_code)
+        if base is None or len(base) < 30:
+            raise SystemExit(f"本地无{args.ts_code}日线，请先运行 sync_daily.py")
+        frames = [base.iloc[:len(base) - i] for i in range(args.charts)]
+    else:
+        frames = [random_bars(seed=i) for i in range(args.charts)]
+
+    renderers = {
+        "mplfinance": lambda df: kline_generator.render_mplfinance("BENCH", df),
+        "fast": lambda df: kline_generator.render_fast("BENCH", df)[0]
+    }
+    results = {}
+    for name, render in renderers.items():
+        first, per_second = bench(render, frames)
+        results[name] = per_second
+        print(f"{name:<12} 首张 {first * 1000:8.1f}ms   吞吐 {per_second:8.1f} 张/秒")
+        if args.save:
+            import os
+            os.makedirs(args.save, exist_ok=True)
+            with open(os.path.join(args.save, f"{name}.png"), "wb") as f:
+                f.write(render(frames[0]))
+    print(f"加速比：{results['fast'] / results['mplfinance']:.1f}x")
@@ -0,0 +1,164 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from loguru import logger
+
+
+class _Flight:
+    """正在进行中的一次加载（同一键的并发调用方共享结果）"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LocalCache:
+    """进程内L1缓存：TTL过期 + 按内存大小LRU淘汰 + 未命中时合并并发加载（single-flight）"""
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_ttl: int = 300):
+        self.max_bytes = max_bytes  # 缓存总大小上限（估算值）
+        self.max_ttl = max_ttl  # 单个条目的最长存活时间（秒）
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, 过期时间戳, 大小)
+        self._flights = {}  # key -> _Flight
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _sizeof(value: any) -> int:
+        """估算缓存值占用的内存大小"""
+        if isinstance(value, (bytes, str)):
+            return len(value)
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(deep=True).sum())
+        if isinstance(value, (dict, list)):
+            try:
+                return len(json.dumps(value, ensure_ascii=False, default=str))
+            except Exception:
+                pass
+        return sys.getsizeof(value)
+
+    def get(self, key: str) -> any:
+        """获取缓存值，不存在或已过期返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: any, ttl: float = None) -> None:
+        """
+        设置缓存值
+        :param key: 缓存键
+        :param value: 缓存值
+        :param ttl: 存活时间（秒），不超过max_ttl
+        """
+        ttl = min(ttl, self.max_ttl) if ttl else self.max_ttl
+        if ttl <= 0:
+            return
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            # 超出大小上限时淘汰最久未使用的条目
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_load(self, key: str, loader) -> any:
+        """
+        获取缓存值，未命中时调用loader加载；同一键的并发未命中只执行一次loader
+        :param key: 缓存键
+        :param loader: 加载函数，返回 (值, 存活秒数)；值为None时不缓存
+        :return: 缓存值
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            # 加锁后再确认一次，避免与刚结束的加载重复执行loader
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            # 等待正在进行的加载完成，直接共享其结果
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            self.loads += 1
+            value, ttl = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def delete(self, key: str) -> None:
+        """删除缓存值"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        """按前缀删除缓存值"""
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        logger.info("L1缓存已清空")
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        """缓存指标：条目数、大小、命中/未命中/加载/淘汰次数"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "loads": self.loads,
+            "evictions": self.evictions
+        }
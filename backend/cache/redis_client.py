@@ -2,15 +2,27 @@ import datetime
 from loguru import logger
 import numpy as np
 import pandas as pd
-import redis  # 仅保留同步redis库
+import redis
+import redis.asyncio as aioredis
+import pyarrow as pa
 import json
 import base64
+import uuid
 from dotenv import load_dotenv
 import os
+from cache.local_cache import LocalCache
 
 # 加载环境变量
 load_dotenv()
 
+# 释放锁：仅当锁值等于自己的令牌时才删除（Lua脚本保证原子性）
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 # 自定义JSON编码器（处理Timestamp/numpy类型）
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -33,8 +45,8 @@ class CustomJSONEncoder(json.JSONEncoder):
         # 兜底：转为字符串
         return str(obj)
 
-class RedisClient:
-    """Redis缓存客户端，封装常用缓存操作（全同步版本）"""
+class CacheCodec:
+    """缓存公共配置与编解码（同步/异步客户端共用）"""
     def __init__(self):
         # 环境变量容错：所有配置加默认值
         self.host = os.getenv("REDIS_HOST", "127.0.0.1")
@@ -43,8 +55,59 @@ class RedisClient:
         self.password = os.getenv("REDIS_PASSWORD") or None
         # 缓存过期时间：加默认值（3600秒=1小时），避免int(None)报错
         self.expire = int(os.getenv("CACHE_EXPIRE", 3600))
+        # DataFrame缓存的压缩算法（zstd/lz4/none）
+        self.frame_compression = os.getenv("CACHE_FRAME_COMPRESSION", "zstd").lower()
+        # 批量读写每批的键数量（每批一次网络往返）
+        self.batch_size = int(os.getenv("CACHE_BATCH_SIZE", 500))
+
+    def _frame_to_bytes(self, df: pd.DataFrame, compression: str = None) -> bytes:
+        """DataFrame序列化为Arrow IPC二进制（可选压缩）"""
+        compression = (compression or self.frame_compression).lower()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @staticmethod
+    def _frame_from_bytes(value: bytes) -> pd.DataFrame:
+        """Arrow IPC二进制还原为DataFrame"""
+        return pa.ipc.open_stream(pa.py_buffer(value)).read_all().to_pandas()
+
+    def _encode_value(self, value: any) -> bytes:
+        """按值类型编码为Redis存储的字节（DataFrame/dict/list/bytes/str）"""
+        if isinstance(value, pd.DataFrame):
+            return self._frame_to_bytes(value)
+        elif isinstance(value, dict) or isinstance(value, list):
+            # 序列化后转字节，避免乱码
+            return json.dumps(value, ensure_ascii=False, cls=CustomJSONEncoder).encode("utf-8")
+        elif isinstance(value, bytes):
+            return value
+        # 字符串转字节存储，统一编码
+        return str(value).encode("utf-8")
+
+    def _decode_value(self, value: bytes, data_type: str) -> any:
+        """按数据类型解析Redis中的字节（str/dict/list/bytes/frame）"""
+        if data_type == "dict" or data_type == "list":
+            return json.loads(value.decode("utf-8"))
+        elif data_type == "bytes":
+            return value
+        elif data_type == "frame":
+            return self._frame_from_bytes(value)
+        return value.decode("utf-8")
+
+class RedisClient(CacheCodec):
+    """Redis缓存客户端，封装常用缓存操作（全同步版本）"""
+    def __init__(self):
+        super().__init__()
+        # 进程内L1缓存（热点键免去Redis往返和反序列化）
+        self.local = LocalCache(
+            max_bytes=int(os.getenv("CACHE_L1_MAX_MB", 256)) * 1024 * 1024,
+            max_ttl=int(os.getenv("CACHE_L1_MAX_TTL", 300))
+        )
 
-        # 初始化同步Redis客户端
+        # 初始化同步Redis客户端（连接在首次请求时建立，导入模块时不访问网络；连通性由预热/就绪检查确认）
         try:
             self.client = redis.Redis(
                 host=self.host,
@@ -55,8 +118,6 @@ class RedisClient:
                 socket_connect_timeout=10,
                 socket_timeout=10
             )
-            # 初始化时检查连接
-            self.ping()
             logger.info("Redis客户端初始化成功")
         except Exception as e:
             logger.error(f"Redis客户端初始化失败: {str(e)}")
@@ -86,18 +147,12 @@ class RedisClient:
             logger.info(f"设置缓存----------: {key}，过期时间: {expire}s")
 
             # 处理不同类型的值
-            if isinstance(value, dict) or isinstance(value, list):
-                logger.info(f"缓存内容（前100字节）: {str(value)[:100]}")
-                # 序列化后转字节，避免乱码
-                value = json.dumps(value, ensure_ascii=False, cls=CustomJSONEncoder).encode("utf-8")
-                self.client.setex(key, expire, value)
-            elif isinstance(value, bytes):
+            if isinstance(value, bytes):
                 logger.info(f"缓存内容为二进制数据，长度: {len(value)}字节")
-                self.client.setex(key, expire, value)
             else:
                 logger.info(f"缓存内容（前100字节）: {str(value)[:100]}")
-                # 字符串转字节存储，统一编码
-                self.client.setex(key, expire, str(value).encode("utf-8"))
+            self.client.setex(key, expire, self._encode_value(value))
+            self.local.delete_prefix(f"{key}#")
             logger.info(f"缓存{key}设置成功")
             return True
         except Exception as e:
@@ -109,7 +164,7 @@ class RedisClient:
         """
         获取缓存（同步）
         :param key: 缓存键
-        :param data_type: 数据类型（str/dict/list/bytes）
+        :param data_type: 数据类型（str/dict/list/bytes/frame）
         """
         try:
             value = self.client.get(key)
@@ -118,12 +173,7 @@ class RedisClient:
                 return None
             
             # 按类型解析
-            if data_type == "dict" or data_type == "list":
-                result = json.loads(value.decode("utf-8"))
-            elif data_type == "bytes":
-                result = value
-            else:
-                result = value.decode("utf-8")
+            result = self._decode_value(value, data_type)
             logger.info(f"获取缓存{key}成功，数据类型: {data_type}")
             return result
         except Exception as e:
@@ -131,10 +181,122 @@ class RedisClient:
             print(f"获取缓存失败: {str(e)}")
             return None
 
+    def get_cache_local(self, key: str, data_type: str = "str") -> any:
+        """
+        获取缓存（先查进程内L1缓存，未命中再查Redis并回填L1）
+        L1存活时间不超过Redis中的剩余TTL；同一键的并发未命中只访问一次Redis
+        :param key: 缓存键
+        :param data_type: 数据类型（str/dict/list/bytes/frame）
+        """
+        def load():
+            try:
+                # GET与TTL合并为一次往返
+                pipe = self.client.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.ttl(key)
+                value, ttl = pipe.execute()
+                if value is None:
+                    logger.info(f"缓存{key}不存在")
+                    return None, 0
+                logger.info(f"获取缓存{key}成功（回填L1），数据类型: {data_type}")
+                return self._decode_value(value, data_type), ttl if ttl > 0 else None
+            except Exception as e:
+                logger.error(f"获取缓存失败----------: {key} -> {str(e)}")
+                print(f"获取缓存失败: {str(e)}")
+                return None, 0
+
+        return self.local.get_or_load(f"{key}#{data_type}", load)
+
+    def set_frame(self, key: str, df: pd.DataFrame, expire: int = None, compression: str = None) -> bool:
+        """
+        以Arrow IPC列式二进制格式缓存DataFrame（保留float32/datetime64等类型）
+        :param key: 缓存键
+        :param df: DataFrame
+        :param expire: 过期时间（默认使用全局配置）
+        :param compression: 压缩算法（zstd/lz4/none，默认使用全局配置）
+        """
+        try:
+            expire = expire or self.expire
+            value = self._frame_to_bytes(df, compression)
+            self.client.setex(key, expire, value)
+            self.local.delete_prefix(f"{key}#")
+            logger.info(f"缓存{key}设置成功（DataFrame {len(df)}行，{len(value)}字节）")
+            return True
+        except Exception as e:
+            logger.error(f"设置DataFrame缓存失败----------: {key} -> {str(e)}")
+            print(f"设置DataFrame缓存失败: {str(e)}")
+            return False
+
+    def get_frame(self, key: str) -> pd.DataFrame:
+        """
+        获取set_frame缓存的DataFrame（类型原样还原，无需再解析日期）
+        :param key: 缓存键
+        :return: DataFrame，不存在返回None
+        """
+        try:
+            value = self.client.get(key)
+            if value is None:
+                logger.info(f"缓存{key}不存在")
+                return None
+            df = self._frame_from_bytes(value)
+            logger.info(f"获取缓存{key}成功，数据类型: DataFrame（{len(df)}行）")
+            return df
+        except Exception as e:
+            logger.error(f"获取DataFrame缓存失败----------: {key} -> {str(e)}")
+            print(f"获取DataFrame缓存失败: {str(e)}")
+            return None
+
+    def get_many(self, keys: list, data_type: str = "str") -> dict:
+        """
+        批量获取缓存（MGET，按批次请求，每批一次网络往返）
+        :param keys: 缓存键列表
+        :param data_type: 数据类型（str/dict/list/bytes/frame）
+        :return: {缓存键: 值}，仅包含命中且解析成功的键
+        """
+        result = {}
+        try:
+            for i in range(0, len(keys), self.batch_size):
+                chunk = keys[i:i + self.batch_size]
+                for key, value in zip(chunk, self.client.mget(chunk)):
+                    if value is None:
+                        continue
+                    try:
+                        result[key] = self._decode_value(value, data_type)
+                    except Exception as e:
+                        logger.error(f"解析缓存失败----------: {key} -> {str(e)}")
+            logger.info(f"批量获取缓存：请求{len(keys)}个，命中{len(result)}个，数据类型: {data_type}")
+        except Exception as e:
+            logger.error(f"批量获取缓存失败----------: {str(e)}")
+            print(f"批量获取缓存失败: {str(e)}")
+        return result
+
+    def set_many(self, mapping: dict, expire: any = None) -> bool:
+        """
+        批量设置缓存（管道化SETEX，按批次提交）
+        :param mapping: {缓存键: 缓存值}（值支持str/dict/list/bytes/DataFrame）
+        :param expire: 过期时间，int为统一过期时间，dict为{缓存键: 过期时间}（缺省使用全局配置）
+        """
+        try:
+            items = list(mapping.items())
+            for i in range(0, len(items), self.batch_size):
+                pipe = self.client.pipeline(transaction=False)
+                for key, value in items[i:i + self.batch_size]:
+                    ttl = expire.get(key) if isinstance(expire, dict) else expire
+                    pipe.setex(key, ttl or self.expire, self._encode_value(value))
+                    self.local.delete_prefix(f"{key}#")
+                pipe.execute()
+            logger.info(f"批量设置缓存成功：{len(items)}个")
+            return True
+        except Exception as e:
+            logger.error(f"批量设置缓存失败----------: {str(e)}")
+            print(f"批量设置缓存失败: {str(e)}")
+            return False
+
     def delete_cache(self, key: str) -> bool:
         """删除指定缓存（同步）"""
         try:
             self.client.delete(key)
+            self.local.delete_prefix(f"{key}#")
             logger.info(f"删除缓存{key}成功")
             return True
         except Exception as e:
@@ -146,6 +308,7 @@ class RedisClient:
         """清空当前数据库所有缓存（谨慎使用）"""
         try:
             self.client.flushdb()
+            self.local.clear()
             logger.warning("清空当前Redis数据库所有缓存！")
             return True
         except Exception as e:
@@ -153,5 +316,200 @@ class RedisClient:
             print(f"清空缓存失败: {str(e)}")
             return False
 
+class AsyncRedisClient(CacheCodec):
+    """Redis缓存客户端（asyncio版本，供FastAPI异步接口使用，Redis变慢时只阻塞等待它的请求）"""
+    def __init__(self, local: LocalCache = None):
+        super().__init__()
+        # 与同步客户端共用L1缓存，任一客户端写入都会使对方的L1条目失效
+        self.local = local
+        self.pool_size = int(os.getenv("REDIS_POOL_SIZE", 50))
+
+        # 连接池在首次使用时才建立连接，初始化不阻塞
+        self.pool = aioredis.ConnectionPool(
+            host=self.host,
+            port=self.port,
+            db=self.db,
+            password=self.password,
+            max_connections=self.pool_size,
+            socket_connect_timeout=10,
+            socket_timeout=10
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+
+    def _invalidate_local(self, key: str) -> None:
+        if self.local:
+            self.local.delete_prefix(f"{key}#")
+
+    async def ping(self) -> bool:
+        """检查Redis连接（异步）"""
+        try:
+            return await self.client.ping()
+        except Exception as e:
+            logger.error(f"Redis连接失败----------: {str(e)}")
+            return False
+
+    async def set_cache(self, key: str, value: any, expire: int = None) -> bool:
+        """
+        设置缓存（异步）
+        :param key: 缓存键
+        :param value: 缓存值（支持str/dict/list/bytes/DataFrame）
+        :param expire: 过期时间（默认使用全局配置）
+        """
+        try:
+            expire = expire or self.expire
+            await self.client.setex(key, expire, self._encode_value(value))
+            self._invalidate_local(key)
+            logger.info(f"缓存{key}设置成功，过期时间: {expire}s")
+            return True
+        except Exception as e:
+            logger.error(f"设置缓存失败----------: {key} -> {str(e)}")
+            return False
+
+    async def get_cache(self, key: str, data_type: str = "str") -> any:
+        """
+        获取缓存（异步）
+        :param key: 缓存键
+        :param data_type: 数据类型（str/dict/list/bytes/frame）
+        """
+        try:
+            value = await self.client.get(key)
+            if value is None:
+                logger.info(f"缓存{key}不存在")
+                return None
+            result = self._decode_value(value, data_type)
+            logger.info(f"获取缓存{key}成功，数据类型: {data_type}")
+            return result
+        except Exception as e:
+            logger.error(f"获取缓存失败----------: {key} -> {str(e)}")
+            return None
+
+    async def set_frame(self, key: str, df: pd.DataFrame, expire: int = None, compression: str = None) -> bool:
+        """以Arrow IPC列式二进制格式缓存DataFrame（异步）"""
+        try:
+            await self.client.setex(key, expire or self.expire, self._frame_to_bytes(df, compression))
+            self._invalidate_local(key)
+            return True
+        except Exception as e:
+            logger.error(f"设置DataFrame缓存失败----------: {key} -> {str(e)}")
+            return False
+
+    async def get_frame(self, key: str) -> pd.DataFrame:
+        """获取set_frame缓存的DataFrame（异步），不存在返回None"""
+        return await self.get_cache(key, "frame")
+
+    async def get_many(self, keys: list, data_type: str = "str") -> dict:
+        """
+        批量获取缓存（异步MGET，按批次请求）
+        :return: {缓存键: 值}，仅包含命中且解析成功的键
+        """
+        result = {}
+        try:
+            for i in range(0, len(keys), self.batch_size):
+                chunk = keys[i:i + self.batch_size]
+                for key, value in zip(chunk, await self.client.mget(chunk)):
+                    if value is None:
+                        continue
+                    try:
+                        result[key] = self._decode_value(value, data_type)
+                    except Exception as e:
+                        logger.error(f"解析缓存失败----------: {key} -> {str(e)}")
+        except Exception as e:
+            logger.error(f"批量获取缓存失败----------: {str(e)}")
+        return result
+
+    async def set_many(self, mapping: dict, expire: any = None) -> bool:
+        """
+        批量设置缓存（异步管道化SETEX）
+        :param expire: int为统一过期时间，dict为{缓存键: 过期时间}
+        """
+        try:
+            items = list(mapping.items())
+            for i in range(0, len(items), self.batch_size):
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for key, value in items[i:i + self.batch_size]:
+                        ttl = expire.get(key) if isinstance(expire, dict) else expire
+                        pipe.setex(key, ttl or self.expire, self._encode_value(value))
+                        self._invalidate_local(key)
+                    await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"批量设置缓存失败----------: {str(e)}")
+            return False
+
+    async def delete_cache(self, key: str) -> bool:
+        """删除指定缓存（异步）"""
+        try:
+            await self.client.delete(key)
+            self._invalidate_local(key)
+            logger.info(f"删除缓存{key}成功")
+            return True
+        except Exception as e:
+            logger.error(f"删除缓存失败----------: {key} -> {str(e)}")
+            return False
+
+    async def acquire_lock(self, key: str, expire: int) -> str:
+        """
+        获取分布式锁（SET NX EX，过期自动释放）
+        :param key: 锁键
+        :param expire: 锁持有上限（秒）
+        :return: 锁令牌（释放时校验），锁已被占用返回None；Redis不可用时视为获取成功，不阻塞业务
+        """
+        token = uuid.uuid4().hex
+        try:
+            if await self.client.set(key, token, nx=True, ex=expire):
+                return token
+            return None
+        except Exception as e:
+            logger.error(f"获取锁失败----------: {key} -> {str(e)}")
+            return token
+
+    async def release_lock(self, key: str, token: str) -> None:
+        """释放分布式锁（只释放自己持有的锁）"""
+        try:
+            # 比较与删除在Redis内原子执行，避免锁过期后误删其他持有者的锁
+            await self.client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+        except Exception as e:
+            logger.error(f"释放锁失败----------: {key} -> {str(e)}")
+
+    async def is_locked(self, key: str) -> bool:
+        """锁是否仍被持有（Redis不可用时返回False）"""
+        try:
+            return bool(await self.client.exists(key))
+        except Exception as e:
+            logger.error(f"查询锁失败----------: {key} -> {str(e)}")
+            return False
+
+    async def delete_prefix(self, prefix: str) -> bool:
+        """按前缀删除缓存（SCAN分批删除，不阻塞Redis）"""
+        try:
+            batch = []
+            async for key in self.client.scan_iter(match=f"{prefix}*", count=self.batch_size):
+                batch.append(key)
+                if len(batch) >= self.batch_size:
+                    await self.client.delete(*batch)
+                    batch = []
+            if batch:
+                await self.client.delete(*batch)
+            if self.local:
+                self.local.delete_prefix(prefix)
+            logger.info(f"按前缀删除缓存{prefix}*成功")
+            return True
+        except Exception as e:
+            logger.error(f"按前缀删除缓存失败----------: {prefix} -> {str(e)}")
+            return False
+
+    async def clear_all_cache(self) -> bool:
+        """清空当前数据库所有缓存（谨慎使用）"""
+        try:
+            await self.client.flushdb()
+            if self.local:
+                self.local.clear()
+            logger.warning("清空当前Redis数据库所有缓存！")
+            return True
+        except Exception as e:
+            logger.error(f"清空缓存失败----------: {str(e)}")
+            return False
+
 # 初始化Redis客户端单例
-redis_client = RedisClient()
\ No newline at end of file
+redis_client = RedisClient()
+async_redis_client = AsyncRedisClient(local=redis_client.local)
\ No newline at end of file
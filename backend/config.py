@@ -10,6 +10,7 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent
 TEMP_DIR = BASE_DIR / "temp"
 TEMP_DIR.mkdir(exist_ok=True)  # 自动创建临时目录
+BAR_STORE_DIR = Path(os.getenv("BAR_STORE_PATH", BASE_DIR / "bar_store"))  # 本地列式日线存储目录
 
 # ==================== 日志配置 ====================
 logger.add(
@@ -48,6 +49,41 @@ API_KEY = os.getenv("API_KEY", "")
 
 logger.info(f"使用的模型：{USE_MODEL}, 使用代理：{USE_PROXY}， API_KEY: {API_KEY}")
 
+# 大模型接口地址（可指向本地桩服务做测试）
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+PROXY_BASE_URL = os.getenv("PROXY_BASE_URL", "https://poloai.top/v1")
+
+# 大模型调用：并发上限 / 超时（秒） / 重试次数 / 重试退避基数（秒）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 1.0))
+
+# ==================== 分析结果缓存配置 ====================
+# 日线数据更新时间（北京时间），分析结果缓存到下一个交易日的该时间为止
+ANALYSIS_REFRESH_TIME = os.getenv("ANALYSIS_REFRESH_TIME", "17:30")
+# 同一缓存键的分析锁持有上限（秒），其他进程最多等待这么久
+ANALYSIS_LOCK_TIMEOUT = int(os.getenv("ANALYSIS_LOCK_TIMEOUT", LLM_TIMEOUT * (LLM_MAX_RETRIES + 1) + 30))
+
+# K线图编码配置：web用于浏览器展示，llm用于发送给大模型（更小的图片 = 更少的上传字节和图片token）
+# format: png / webp / jpeg；quality: webp/jpeg压缩质量（1-100）；width: 目标宽度像素（0表示原尺寸，按比例缩放）
+KLINE_IMAGE_PROFILES = {
+    "web": {
+        "format": os.getenv("KLINE_WEB_FORMAT", "png").lower(),
+        "quality": int(os.getenv("KLINE_WEB_QUALITY", 90)),
+        "width": int(os.getenv("KLINE_WEB_WIDTH", 0))
+    },
+    "llm": {
+        "format": os.getenv("KLINE_LLM_FORMAT", "webp").lower(),
+        "quality": int(os.getenv("KLINE_LLM_QUALITY", 80)),
+        "width": int(os.getenv("KLINE_LLM_WIDTH", 768))
+    }
+}
+
+# 相似K线检索方式：numeric（日线数值窗口向量，不渲染不经过CLIP） / clip（K线图CLIP特征）
+KLINE_SIMILARITY_MODE = os.getenv("KLINE_SIMILARITY_MODE", "numeric").lower()
+
 # ==================== 服务器配置 ====================
 HOST = os.getenv("HOST", "127.0.0.1")
 PORT = int(os.getenv("PORT", 8000))
@@ -0,0 +1,60 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# 导入耗时预算报告（用 python -X importtime 在干净子进程中导入目标模块）
+# 用法：python import_report.py                  # 统计 import main，预算取IMPORT_BUDGET_MS
+#      python import_report.py --top 30 --budget 1500 utils.utils
+# 总耗时超出预算时以非零状态退出，可接入CI防止冷启动变慢
+
+
+def measure_imports(module: str) -> list:
+    """
+    在子进程中导入模块并解析 -X importtime 输出
+    :param module: 模块名
+    :return: [(模块名, 自身耗时ms, 累计耗时ms)]，按导入顺序
+    """
+    env = dict(os.environ, WARMUP_ON_STARTUP="false")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入{module}失败:\n{proc.stderr[-2000:]}")
+
+    records = []
+    for line in proc.stderr.splitlines():
+        # 格式：import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        records.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="统计模块导入耗时并与冷启动预算对比")
+    parser.add_argument("module", nargs="?", default="main", help="要统计的模块（默认main）")
+    parser.add_argument("--top", type=int, default=20, help="列出累计耗时最高的顶层依赖数量")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", 3000)),
+                        help="导入总耗时预算（毫秒）")
+    args = parser.parse_args()
+
+    records = measure_imports(args.module)
+    total = next((cumulative for name, _, cumulative in records if name == args.module), 0.0)
+    # 只看顶层包（如torch、chromadb），子模块耗时已计入其累计值
+    top_level = {}
+    for name, _, cumulative in records:
+        if "." not in name:
+            top_level[name] = max(top_level.get(name, 0.0), cumulative)
+    ranked = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    print(f"{'模块':<40}{'累计耗时(ms)':>14}")
+    for name, cumulative in ranked:
+        print(f"{name:<40}{cumulative:>14.1f}")
+    print(f"\nimport {args.module} 总耗时 {total:.1f}ms，预算 {args.budget:.0f}ms")
+
+    if total > args.budget:
+        print("超出导入耗时预算！", file=sys.stderr)
+        sys.exit(1)
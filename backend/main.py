@@ -1,29 +1,30 @@
+import asyncio
 from datetime import datetime
 import json
 import os
-import io
-import base64
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import chromadb
-from chromadb.utils import embedding_functions
 import numpy as np
-import openai
-import google.generativeai as genai
 import pandas as pd
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from loguru import logger
-from config import HOST, PORT, MAX_FILE_SIZE, USE_MODEL
-from utils.utils import analyze_uploaded_kline_image, save_uploaded_file, analyze_kline_image, clean_temp_file
+from config import HOST, PORT, MAX_FILE_SIZE, USE_MODEL, KLINE_IMAGE_PROFILES, KLINE_SIMILARITY_MODE
+from utils.utils import analyze_uploaded_kline_image, analyze_kline_image, close_llm_client
 
 # 导入自定义模块
-from cache.redis_client import CustomJSONEncoder, redis_client
-from stock.stock_selector import stock_selector
+from cache.redis_client import CustomJSONEncoder, redis_client, async_redis_client
+from stock.stock_selector import stock_selector, baostock_session
+from stock.universe_fetcher import universe_fetcher
 from stock.kline_generator import kline_generator
-from utils.image_utils import extract_image_embedding
+from utils.image_utils import load_clip, clip_loaded
+from utils.batch_pipeline import resolve_batch, run_batch_analysis, iter_batch_analysis
+from utils.job_queue import batch_job_queue
 
 # 加载环境变量
 load_dotenv()
@@ -44,21 +45,88 @@ app.add_middleware(
 )
 
 # ====================== 初始化组件 ======================
+# 重量级组件（ChromaDB/CLIP）延迟到首次使用或预热时初始化，进程启动只需导入轻量模块
+# 启动后是否在后台预热（预热完成前 /ready 返回503）
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+# 指定截止交易日的K线图地址允许浏览器缓存的时间（秒）
+KLINE_IMAGE_MAX_AGE = int(os.getenv("KLINE_IMAGE_MAX_AGE", 86400))
+
 # 1. 向量数据库
-chroma_client = chromadb.PersistentClient(
-    path=os.getenv("CHROMA_PATH", os.getenv("CHROMA_PATH")),  # 向量数据存储路径
-    tenant="default_tenant" # 1.3.5新增多租户特性（默认即可）
-)
+_stock_collection = None
+_collection_lock = threading.Lock()
 
-# 初始化默认嵌入函数（用于文本/特征向量转换）
-default_ef = embedding_functions.DefaultEmbeddingFunction()
+def get_stock_collection():
+    """
+    获取股票特征向量集合（线程安全，首次调用时初始化ChromaDB）
+    :return: ChromaDB集合
+    """
+    global _stock_collection
+    if _stock_collection is not None:
+        return _stock_collection
+    with _collection_lock:
+        if _stock_collection is None:
+            import chromadb
+            from chromadb.utils import embedding_functions
 
-# 创建/获取股票特征向量集合（1.3.5自动创建不存在的集合）
-stock_collection = chroma_client.get_or_create_collection(
-    name="stock_macd_features",
-    embedding_function=default_ef,  # 绑定嵌入函数
-    metadata={"description": "存储股票MACD特征向量及分析结果"}
-)
+            chroma_client = chromadb.PersistentClient(
+                path=os.getenv("CHROMA_PATH", os.getenv("CHROMA_PATH")),  # 向量数据存储路径
+                tenant="default_tenant" # 1.3.5新增多租户特性（默认即可）
+            )
+
+            # 初始化默认嵌入函数（用于文本/特征向量转换）
+            default_ef = embedding_functions.DefaultEmbeddingFunction()
+
+            # 创建/获取股票特征向量集合（1.3.5自动创建不存在的集合）
+            _stock_collection = chroma_client.get_or_create_collection(
+                name="stock_macd_features",
+                embedding_function=default_ef,  # 绑定嵌入函数
+                metadata={"description": "存储股票MACD特征向量及分析结果"}
+            )
+            logger.info("ChromaDB集合初始化完成")
+    return _stock_collection
+
+async def get_stock_collection_async():
+    """
+    异步获取股票特征向量集合（未初始化时在线程池中初始化ChromaDB，不阻塞事件循环）
+    :return: ChromaDB集合
+    """
+    if _stock_collection is not None:
+        return _stock_collection
+    return await asyncio.get_running_loop().run_in_executor(None, get_stock_collection)
+
+# 2. 预热状态（各组件预热耗时，供 /ready 返回）
+warmup_state = {"done": False, "error": None, "timings": {}}
+
+def warmup_loaders() -> list:
+    """按相似K线检索方式确定需要预热的组件（numeric方式不使用CLIP，无需加载模型）"""
+    loaders = [("chroma", get_stock_collection)]
+    if KLINE_SIMILARITY_MODE == "clip":
+        loaders.append(("clip", load_clip))
+    loaders.append(("render", kline_generator.start_render_pool))
+    return loaders
+
+async def warmup() -> dict:
+    """
+    预热重量级组件：ChromaDB → CLIP模型（仅clip相似检索方式） → K线渲染进程池 → Redis连接（在线程中加载，不阻塞事件循环）
+    :return: 预热状态
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        for name, loader in warmup_loaders():
+            start = time.perf_counter()
+            await loop.run_in_executor(None, loader)
+            warmup_state["timings"][name] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        if not await async_redis_client.ping():
+            raise RuntimeError("Redis连接失败")
+        warmup_state["timings"]["redis"] = round(time.perf_counter() - start, 3)
+        warmup_state["done"] = True
+        warmup_state["error"] = None
+        logger.info(f"组件预热完成：{warmup_state['timings']}")
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        logger.error(f"组件预热失败: {str(e)}")
+    return warmup_state
 
 # ===================== 工具函数（辅助逻辑） =====================
 def generate_stock_embedding(stock_data: Dict) -> List[float]:
@@ -82,6 +150,99 @@ def generate_stock_embedding(stock_data: Dict) -> List[float]:
     except Exception as e:
         raise RuntimeError(f"生成股票特征向量失败: {str(e)}")
 
+def upsert_stock_features(selected_stocks: List[Dict]) -> None:
+    """
+    将选股结果的特征向量批量存入ChromaDB（存在则更新）
+    :param selected_stocks: 选股结果
+    """
+    stock_ids = []
+    stock_embeddings = []
+    stock_metadatas = []
+    stock_documents = []
+    
+    for stock in selected_stocks:
+        stock_id = stock["ts_code"]  # 用股票代码作为唯一ID
+        # 生成特征向量
+        embedding = generate_stock_embedding(stock)
+        logger.info(f"生成特征向量，长度：{len(embedding)}")
+        # 构造元数据和文档
+        metadata = {
+            "symbol": stock["symbol"],
+            "name": stock["name"],
+            "industry": stock.get("industry", "未知"),
+            "dif": stock.get("dif", 0.0),
+            "dea": stock.get("dea", 0.0),
+            "macd": stock.get("macd", 0.0),
+            "latest_price": stock.get("latest_price", 0.0)
+        }
+        document = f"股票{stock['name']}({stock['ts_code']})，行业{stock.get('industry', '未知')}，MACD金叉，DIF={stock.get('dif', 0.0)}，DEA={stock.get('dea', 0.0)}，MACD={stock.get('macd', 0.0)}，最新价={stock.get('latest_price', 0.0)}"
+        
+        stock_ids.append(stock_id)
+        stock_embeddings.append(embedding)
+        stock_metadatas.append(metadata)
+        stock_documents.append(document)
+    
+    # 批量添加到ChromaDB（存在则更新）
+    if stock_ids:
+        get_stock_collection().upsert(
+            ids=stock_ids,
+            embeddings=stock_embeddings,
+            metadatas=stock_metadatas,
+            documents=stock_documents
+        )
+
+def ndjson_line(obj: Dict) -> bytes:
+    """序列化为一行NDJSON"""
+    return (json.dumps(obj, ensure_ascii=False, cls=CustomJSONEncoder) + "\n").encode("utf-8")
+
+def sse_event(obj: Dict) -> bytes:
+    """序列化为一条Server-Sent Events消息（event为消息类型）"""
+    data = json.dumps(obj, ensure_ascii=False, cls=CustomJSONEncoder)
+    return f"event: {obj.get('type', 'message')}\ndata: {data}\n\n".encode("utf-8")
+
+def stream_response(events, stream_format: str) -> StreamingResponse:
+    """
+    将事件异步生成器包装为流式响应
+    :param events: 产出dict事件的异步生成器
+    :param stream_format: ndjson / sse
+    """
+    encode, media_type = (sse_event, "text/event-stream") if stream_format == "sse" else (ndjson_line, "application/x-ndjson")
+
+    async def body():
+        async for event in events:
+            yield encode(event)
+
+    # 禁止反向代理缓冲，保证每条结果立即送达
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def image_response(request: Request, image: bytes, media_type: str, trade_date: str, immutable: bool) -> Response:
+    """
+    返回图片二进制响应（ETag/Last-Modified，条件请求命中时返回304）
+    :param trade_date: K线截止交易日（YYYYMMDD），收盘时间作为Last-Modified
+    :param immutable: 地址中指定了截止交易日，内容不再变化，允许浏览器直接缓存
+    """
+    etag = f'"{hashlib.blake2b(image, digest_size=16).hexdigest()}"'
+    modified = pd.Timestamp(trade_date).tz_localize("Asia/Shanghai") + pd.Timedelta(hours=15)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified.timestamp(), usegmt=True),
+        "Cache-Control": f"public, max-age={KLINE_IMAGE_MAX_AGE}" if immutable else "no-cache"
+    }
+
+    # If-None-Match优先；没有时才比较If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        not_modified = etag in tags or "*" in tags
+    else:
+        try:
+            not_modified = parsedate_to_datetime(request.headers["if-modified-since"]) >= modified.floor("s")
+        except (KeyError, TypeError, ValueError):
+            not_modified = False
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image, media_type=media_type, headers=headers)
+
 # 文件大小限制中间件
 @app.middleware("http")
 async def limit_file_size(request: Request, call_next):
@@ -101,6 +262,20 @@ async def limit_file_size(request: Request, call_next):
     response = await call_next(request)
     return response
 
+@app.on_event("startup")
+async def startup():
+    """服务启动后在后台预热重量级组件，不推迟端口监听"""
+    if WARMUP_ON_STARTUP:
+        asyncio.create_task(warmup())
+
+@app.on_event("shutdown")
+async def shutdown():
+    """服务停止时取消未完成的后台任务，释放大模型HTTP连接池、渲染进程池和日线拉取进程池"""
+    await batch_job_queue.shutdown()
+    await close_llm_client()
+    kline_generator.shutdown()
+    universe_fetcher.shutdown()
+
 @app.middleware("http")
 async def custom_json_encoder(request, call_next):
     response = await call_next(request)
@@ -149,23 +324,18 @@ async def analyze_kline(kline_image: UploadFile = File(...)):
                 detail=f"不支持的文件格式：{file_ext}，仅支持{','.join(allowed_extensions)}"
             )
         
-        # 2. 读取并保存文件
-        file_content = await kline_image.read()
-        file_path = save_uploaded_file(file_content, file_ext)
+        # 2. 读取文件（Starlette已将较大的上传暂存到临时文件，大小已由中间件按MAX_FILE_SIZE限制）
+        image = await kline_image.read()
+
+        # 3. AI分析
+        analysis_result = await analyze_uploaded_kline_image(image)
         
-        try:
-            # 3. AI分析
-            analysis_result = await analyze_uploaded_kline_image(file_path)
-            
-            # 4. 返回结果
-            return { "data": {
-                "success": True,
-                "data": analysis_result
-                }
+        # 4. 返回结果
+        return { "data": {
+            "success": True,
+            "data": analysis_result
             }
-        finally:
-            # 5. 清理临时文件
-            clean_temp_file(file_path)
+        }
     
     except HTTPException as e:
         logger.error(f"请求错误：{e.detail}")
@@ -184,18 +354,49 @@ async def analyze_kline(kline_image: UploadFile = File(...)):
 @app.get("/health", summary="服务健康检查")
 async def health_check():
     """检查服务状态（Redis/数据库/大模型）"""
-    redis_status = redis_client.ping()
+    redis_status = await async_redis_client.ping()
     logger.info(f"Redis连接状态-----------: {redis_status}")
-    chroma_count = stock_collection.count()
+    # 不在健康检查中初始化ChromaDB（与 /ready 一致），已初始化时才在线程池中统计数据量
+    chroma_loaded = _stock_collection is not None
+    chroma_count = await asyncio.get_running_loop().run_in_executor(None, _stock_collection.count) if chroma_loaded else None
     
     return {
         "status": "healthy" if redis_status else "unhealthy",
         "redis_connected": redis_status,
+        "chroma_loaded": chroma_loaded,
         "chroma_count": chroma_count,
+        "baostock": baostock_session.metrics(),
+        "l1_cache": redis_client.local.stats(),
         "llm_type": USE_MODEL,
         "timestamp": str(pd.Timestamp.now())
     }
 
+@app.get("/ready", summary="服务就绪检查")
+async def readiness_check(warm: bool = Query(False, description="未就绪时是否立即触发预热（等待预热完成）")):
+    """
+    就绪检查（供负载均衡/编排系统使用）：重量级组件预热完成且Redis可达时返回200，否则返回503
+    与 /health 不同，本接口不会在请求中初始化任何组件（warm=true时除外）
+    """
+    if warm and not warmup_state["done"]:
+        await warmup()
+    redis_status = await async_redis_client.ping()
+    components = {
+        "redis": redis_status,
+        "chroma": _stock_collection is not None
+    }
+    if KLINE_SIMILARITY_MODE == "clip":
+        components["clip"] = clip_loaded()
+    ready = warmup_state["done"] and all(components.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "components": components,
+            "warmup": warmup_state,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
 @app.get("/select-stocks", summary="MACD金叉选股")
 async def select_stocks(
     fast: Optional[int] = Query(None, description="MACD快速周期"),
@@ -209,47 +410,14 @@ async def select_stocks(
             raise HTTPException(status_code=500, detail="选股器初始化失败")
         
         logger.info(f"开始执行MACD金叉选股，参数fast={fast}, slow={slow}, signal={signal}, limit={limit}")
-        # 执行选股
-        selected_stocks = stock_selector.select_stocks(fast=fast, slow=slow, signal=signal)
+        # 执行选股（同步Redis/本地存储/多进程拉取，在线程池中执行，不阻塞事件循环）
+        loop = asyncio.get_running_loop()
+        selected_stocks = await loop.run_in_executor(None, stock_selector.select_stocks, fast, slow, signal)
         selected_stocks = selected_stocks[:limit]
         logger.info(f"选出{len(selected_stocks)}只符合MACD金叉条件的股票")
         
         # 批量存入ChromaDB（1.3.5支持批量操作）
-        stock_ids = []
-        stock_embeddings = []
-        stock_metadatas = []
-        stock_documents = []
-        
-        for stock in selected_stocks:
-            stock_id = stock["ts_code"]  # 用股票代码作为唯一ID
-            # 生成特征向量
-            embedding = generate_stock_embedding(stock)
-            logger.info(f"生成特征向量，长度：{len(embedding)}")
-            # 构造元数据和文档
-            metadata = {
-                "symbol": stock["symbol"],
-                "name": stock["name"],
-                "industry": stock.get("industry", "未知"),
-                "dif": stock.get("dif", 0.0),
-                "dea": stock.get("dea", 0.0),
-                "macd": stock.get("macd", 0.0),
-                "latest_price": stock.get("latest_price", 0.0)
-            }
-            document = f"股票{stock['name']}({stock['ts_code']})，行业{stock.get('industry', '未知')}，MACD金叉，DIF={stock.get('dif', 0.0)}，DEA={stock.get('dea', 0.0)}，MACD={stock.get('macd', 0.0)}，最新价={stock.get('latest_price', 0.0)}"
-            
-            stock_ids.append(stock_id)
-            stock_embeddings.append(embedding)
-            stock_metadatas.append(metadata)
-            stock_documents.append(document)
-        
-        # 批量添加到ChromaDB（存在则更新）
-        if stock_ids:
-            stock_collection.upsert(
-                ids=stock_ids,
-                embeddings=stock_embeddings,
-                metadatas=stock_metadatas,
-                documents=stock_documents
-            )
+        await loop.run_in_executor(None, upsert_stock_features, selected_stocks)
         
         return {
             "code": 200,
@@ -268,14 +436,15 @@ async def select_stocks(
 async def get_stock_detail(ts_code: str) -> Dict:
     """获取股票详情，并从ChromaDB查询相似股票"""
     try:
-        # 1. 获取股票基础数据
-        stock_list = stock_selector.get_stock_list()
+        # 1. 获取股票基础数据（同步Redis/Baostock调用在线程池中执行）
+        loop = asyncio.get_running_loop()
+        stock_list = await loop.run_in_executor(None, stock_selector.get_stock_list)
         stock_info = next((s for s in stock_list if s["ts_code"] == ts_code), None)
         if not stock_info:
             raise HTTPException(status_code=404, detail=f"股票{ts_code}不存在")
         
         # 2. 获取日线数据和MACD
-        daily_df = stock_selector.get_daily_data(ts_code)
+        daily_df = await loop.run_in_executor(None, stock_selector.get_daily_data, ts_code)
         daily_df = stock_selector.calculate_macd(daily_df)
         latest_row = daily_df.tail(1).iloc[0]
         
@@ -292,11 +461,11 @@ async def get_stock_detail(ts_code: str) -> Dict:
         
         # 3. 从ChromaDB查询相似股票（基于特征向量）
         query_embedding = generate_stock_embedding(stock_detail)
-        similar_stocks = stock_collection.query(
+        similar_stocks = await loop.run_in_executor(None, lambda: get_stock_collection().query(
             query_embeddings=[query_embedding],
             n_results=5,  # 返回Top5相似股票
             where={"industry": stock_info.get("industry", "未知")}  # 按行业过滤
-        )
+        ))
         
         # 格式化相似股票结果
         similar_list = []
@@ -330,7 +499,10 @@ async def clear_chroma_collection():
     """清空股票特征向量集合（谨慎使用）"""
     try:
         # 方式1：清空集合（保留集合）
-        stock_collection.delete(ids=stock_collection.get()["ids"])
+        stock_collection = await get_stock_collection_async()
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: stock_collection.delete(ids=stock_collection.get()["ids"])
+        )
         # 方式2：删除集合（需重新创建）
         # chroma_client.delete_collection(name="stock_macd_features")
         
@@ -342,25 +514,58 @@ async def clear_chroma_collection():
 async def generate_kline(ts_code: str = Query(..., description="股票代码（如600519.SH）")):
     """生成指定股票的K线图"""
     try:
-        # 获取日线数据
-        df = stock_selector.get_daily_data(ts_code)
+        # 获取日线数据（线程池中执行，不阻塞事件循环）
+        df = await asyncio.get_running_loop().run_in_executor(None, stock_selector.get_daily_data, ts_code)
         if df.empty:
             raise HTTPException(status_code=400, detail="股票数据为空")
         
-        # 生成K线图
-        img_bytes = kline_generator.generate_kline(ts_code, df)
+        # 生成K线图（写入缓存，浏览器随后按地址读取）
+        await kline_generator.generate_kline_async(ts_code, df)
         
-        # 返回Base64编码的图片
-        img_base64 = base64.b64encode(img_bytes).decode("utf-8")
+        # 返回图片地址
         return {
             "status": "success",
             "ts_code": ts_code,
-            "image_base64": img_base64,
+            "image_url": kline_generator.image_url(ts_code, df),
             "timestamp": str(pd.Timestamp.now())
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成K线图失败: {str(e)}")
 
+@app.get("/kline/{ts_code}.{ext}", summary="获取K线图图片")
+async def get_kline_image(
+    request: Request,
+    ts_code: str,
+    ext: str,
+    date: str = Query(default=None, description="K线截止交易日（YYYYMMDD，默认最新）"),
+    profile: str = Query(default="web", description="编码配置（web：浏览器展示，llm：发送给大模型）")
+):
+    """按股票代码和截止交易日返回K线图二进制（支持ETag/Last-Modified条件请求）"""
+    if profile not in KLINE_IMAGE_PROFILES or ext != kline_generator.image_ext(profile):
+        raise HTTPException(status_code=404, detail=f"K线图不存在: {ts_code}.{ext}")
+    if date:
+        try:
+            date = pd.Timestamp(date).strftime("%Y%m%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的交易日: {date}")
+    try:
+        # 指定截止交易日时优先读取缓存，无需加载日线
+        image = await kline_generator.get_cached_image(ts_code, date, profile) if date else None
+        trade_date = date
+        if image is None:
+            df = await asyncio.get_running_loop().run_in_executor(None, stock_selector.get_daily_data, ts_code)
+            if date and df is not None:
+                df = df[pd.to_datetime(df["trade_date"]) <= pd.Timestamp(date)]
+            if df is None or df.empty:
+                raise HTTPException(status_code=404, detail=f"股票{ts_code}无日线数据")
+            image = await kline_generator.generate_kline_async(ts_code, df, profile)
+            trade_date = kline_generator.image_date(df)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取K线图失败: {str(e)}")
+    return image_response(request, image, kline_generator.image_mime(profile), trade_date, immutable=bool(date))
+
 @app.post("/analyze-stock", summary="分析指定股票")
 async def analyze_stock(
     ts_code: str = Body(..., embed=True, description="股票代码"),
@@ -368,26 +573,26 @@ async def analyze_stock(
 ):
     """分析指定股票（自动生成K线图并调用大模型）"""
     try:
-        # 1. 获取日线数据
-        df = stock_selector.get_daily_data(ts_code)
+        # 1. 获取日线数据（线程池中执行，不阻塞事件循环）
+        loop = asyncio.get_running_loop()
+        df = await loop.run_in_executor(None, stock_selector.get_daily_data, ts_code)
         if df.empty:
             raise HTTPException(status_code=400, detail="股票数据为空")
         
-        # 2. 生成K线图
-        img_bytes = kline_generator.generate_kline(ts_code, df)
-        file_path = save_uploaded_file(img_bytes, "png")
+        # 2. 生成K线图（展示图 + 发给大模型的压缩图，只渲染一次）
+        images = await kline_generator.generate_kline_images_async(ts_code, df)
         
-        # 3. 分析K线图
-        analysis_result = await analyze_kline_image(file_path, ts_code, stock_collection, redis_client, user_question)
+        # 3. 分析K线图（直接传入图片数据，不经过临时文件）
+        analysis_result = await analyze_kline_image(images["llm"], ts_code, await get_stock_collection_async(), async_redis_client, user_question)
         
-        # 4. 返回结果（包含Base64图片）
-        img_base64 = base64.b64encode(img_bytes).decode("utf-8")
+        # 4. 返回结果（图片通过地址单独加载）
+        stock_list = await loop.run_in_executor(None, stock_selector.get_stock_list)
         return {
             "data": {
                 "status": "success",
                 "ts_code": ts_code,
-                "stock_name": next((s['name'] for s in (stock_selector.get_stock_list()) if s['ts_code'] == ts_code), "未知"),
-                "image_base64": img_base64,
+                "stock_name": next((s['name'] for s in stock_list if s['ts_code'] == ts_code), "未知"),
+                "image_url": kline_generator.image_url(ts_code, df),
                 "analysis_result": analysis_result,
                 "timestamp": str(pd.Timestamp.now()),
                 "llm_type": USE_MODEL
@@ -400,12 +605,15 @@ async def analyze_stock(
 async def batch_analyze(
     fast: int = Body(default=None, embed=True, description="MACD快速周期"),
     slow: int = Body(default=None, embed=True, description="MACD慢速周期"),
-    signal: int = Body(default=None, embed=True, description="MACD信号周期")
+    signal: int = Body(default=None, embed=True, description="MACD信号周期"),
+    batch_size: int = Body(default=None, embed=True, description="批量分析数量（默认BATCH_ANALYZE_SIZE，<=0表示全部）")
 ):
-    """批量分析MACD金叉选股结果"""
+    """批量分析MACD金叉选股结果（渲染/特征提取/大模型分阶段并发执行）"""
     try:
-        # 1. 选股
-        selected_stocks = stock_selector.select_stocks(fast, slow, signal)
+        # 1. 选股（在线程中执行，不阻塞事件循环）
+        selected_stocks = await asyncio.get_running_loop().run_in_executor(
+            None, stock_selector.select_stocks, fast, slow, signal
+        )
         if not selected_stocks:
             # 返回标准化可序列化响应
             return JSONResponse(
@@ -419,46 +627,10 @@ async def batch_analyze(
                 status_code=200
             )
         
-        # 2. 批量分析
-        batch_result = []
-        for stock in selected_stocks[:10]:  # 限制批量分析数量
-            ts_code = stock['ts_code']
-            if not ts_code:
-                continue  # 跳过无代码的股票
-            try:
-                # 获取日线数据
-                df = stock_selector.get_daily_data(ts_code)
-                if df.empty:
-                    continue
-                
-                # 生成K线图
-                img_bytes = kline_generator.generate_kline(ts_code, df)
-                file_path = save_uploaded_file(img_bytes, "png")
-                
-                # 分析K线图
-                analysis_result = await analyze_kline_image(file_path, ts_code, stock_collection, redis_client)
-                
-                # 标准化分析结果（处理numpy/自定义类型）
-                analysis_result = json.loads(json.dumps(analysis_result, cls=CustomJSONEncoder))
-                
-                # 构建结果
-                 # 构建单条结果：逐字段类型转换，确保可序列化
-                single_result = {
-                    "ts_code": str(ts_code),  # 确保是字符串
-                    "stock_name": str(stock.get('name', '')),  # 兜底空字符串
-                    "industry": str(stock.get('industry', '')),
-                    # 修复：numpy数值转Python原生类型（如np.float64 → float）
-                    "latest_price": float(stock.get('latest_price', 0.0)) if stock.get('latest_price') is not None else 0.0,
-                    "macd": float(stock.get('macd', 0.0)) if stock.get('macd') is not None else 0.0,
-                    "analysis_result": analysis_result,  # 已标准化的分析结果
-                    # base64编码后的字符串是JSON可序列化的
-                    "image_base64": base64.b64encode(img_bytes).decode("utf-8") if img_bytes else ""
-                }
-                batch_result.append(single_result)
-
-            except Exception as e:
-                print(f"批量分析{ts_code}失败: {str(e)}")
-                continue
+        # 2. 批量分析（并发流水线，单只失败不影响其他股票）
+        batch_result = await run_batch_analysis(
+            resolve_batch(selected_stocks, batch_size), await get_stock_collection_async(), async_redis_client
+        )
         
         # ========== 构建最终响应：全字段可序列化 ==========
         final_response = { "data": {
@@ -479,6 +651,118 @@ async def batch_analyze(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"批量分析失败: {str(e)}")
 
+@app.get("/select-stocks/stream", summary="MACD金叉选股（流式返回）")
+async def select_stocks_stream(
+    fast: Optional[int] = Query(None, description="MACD快速周期"),
+    slow: Optional[int] = Query(None, description="MACD慢速周期"),
+    signal: Optional[int] = Query(None, description="MACD信号周期"),
+    limit: Optional[int] = Query(50, description="选股数量上限"),
+    stream_format: str = Query("ndjson", description="流格式：ndjson / sse")
+):
+    """
+    流式返回选股结果，事件依次为：
+    meta（选中数量） → item（每只股票一条） → done；出错时返回error
+    """
+    if not stock_selector:
+        raise HTTPException(status_code=500, detail="选股器初始化失败")
+
+    async def events():
+        try:
+            loop = asyncio.get_running_loop()
+            selected_stocks = await loop.run_in_executor(None, stock_selector.select_stocks, fast, slow, signal)
+            selected_stocks = selected_stocks[:limit]
+            yield {"type": "meta", "count": len(selected_stocks)}
+            for index, stock in enumerate(selected_stocks):
+                yield {"type": "item", "index": index, "data": stock}
+            await loop.run_in_executor(None, upsert_stock_features, selected_stocks)
+            yield {"type": "done", "count": len(selected_stocks), "timestamp": datetime.now().isoformat()}
+        except Exception as e:
+            logger.error(f"流式选股失败: {str(e)}")
+            yield {"type": "error", "error": f"选股失败: {str(e)}"}
+
+    return stream_response(events(), stream_format)
+
+@app.post("/batch-analyze/stream", summary="批量分析选股结果（流式返回）")
+async def batch_analyze_stream(
+    fast: int = Body(default=None, embed=True, description="MACD快速周期"),
+    slow: int = Body(default=None, embed=True, description="MACD慢速周期"),
+    signal: int = Body(default=None, embed=True, description="MACD信号周期"),
+    batch_size: int = Body(default=None, embed=True, description="批量分析数量（默认BATCH_ANALYZE_SIZE，<=0表示全部）"),
+    stream_format: str = Body(default="ndjson", embed=True, description="流格式：ndjson / sse")
+):
+    """
+    每只股票分析完成后立即推送，服务端不再同时持有全部图片，事件依次为：
+    meta（选中/待分析数量） → item（按完成顺序，index为在待分析列表中的序号） → done；出错时返回error
+    """
+    async def events():
+        try:
+            selected_stocks = await asyncio.get_running_loop().run_in_executor(
+                None, stock_selector.select_stocks, fast, slow, signal
+            )
+            stocks = resolve_batch(selected_stocks, batch_size)
+            yield {"type": "meta", "total_selected": len(selected_stocks), "count": len(stocks)}
+            count = 0
+            async for index, result in iter_batch_analysis(stocks, await get_stock_collection_async(), async_redis_client):
+                count += 1
+                yield {"type": "item", "index": index, "data": result}
+            yield {"type": "done", "count": count, "timestamp": datetime.now().isoformat()}
+        except Exception as e:
+            logger.error(f"流式批量分析失败: {str(e)}")
+            yield {"type": "error", "error": f"批量分析失败: {str(e)}"}
+
+    return stream_response(events(), stream_format)
+
+@app.post("/jobs/batch-analyze", summary="提交批量分析后台任务")
+async def submit_batch_analyze_job(
+    fast: int = Body(default=None, embed=True, description="MACD快速周期"),
+    slow: int = Body(default=None, embed=True, description="MACD慢速周期"),
+    signal: int = Body(default=None, embed=True, description="MACD信号周期"),
+    batch_size: int = Body(default=None, embed=True, description="批量分析数量（默认BATCH_ANALYZE_SIZE，<=0表示全部）")
+):
+    """
+    立即返回任务ID，分析在后台执行；相同参数在同一交易日内重复提交返回同一任务
+    通过 GET /jobs/{job_id} 查询进度，GET /jobs/{job_id}/results 获取（部分）结果
+    """
+    try:
+        params = {"fast": fast, "slow": slow, "signal": signal, "batch_size": batch_size}
+        job = await batch_job_queue.submit(params, await get_stock_collection_async(), async_redis_client)
+        return {"status": "success", "job": job, "timestamp": datetime.now().isoformat()}
+    except Exception as e:
+        logger.error(f"提交批量分析任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"提交任务失败: {str(e)}")
+
+@app.get("/jobs/{job_id}", summary="查询批量分析任务进度")
+async def get_batch_analyze_job(job_id: str):
+    """返回任务状态（queued/running/done/failed）与进度"""
+    job = await batch_job_queue.get(job_id, async_redis_client)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务{job_id}不存在或已过期")
+    return {"status": "success", "job": job, "timestamp": datetime.now().isoformat()}
+
+@app.get("/jobs/{job_id}/results", summary="获取批量分析任务结果")
+async def get_batch_analyze_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="跳过已获取的结果条数（按完成顺序，用于增量轮询）")
+):
+    """返回任务已完成的结果，任务运行中也可调用获取部分结果"""
+    job = await batch_job_queue.get(job_id, async_redis_client)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务{job_id}不存在或已过期")
+    items = await batch_job_queue.results(job, async_redis_client, offset)
+    return JSONResponse(
+        content={
+            "status": "success",
+            "job_status": job["status"],
+            "completed": job["completed"],
+            "total": job["total"],
+            "offset": offset,
+            "count": len(items),
+            "data": items,
+            "timestamp": datetime.now().isoformat()
+        },
+        status_code=200
+    )
+
 @app.post("/clear-cache", summary="清理缓存")
 async def clear_cache(
     cache_type: str = Body(default="all", embed=True, description="缓存类型：all/stock/kline/analysis")
@@ -486,13 +770,10 @@ async def clear_cache(
     """清理指定类型的缓存"""
     try:
         if cache_type == "all":
-            success = redis_client.clear_all_cache()
+            success = await async_redis_client.clear_all_cache()
         else:
             # 按前缀删除
-            keys = redis_client.client.keys(f"{cache_type}:*")
-            if keys:
-                redis_client.client.delete(*keys)
-            success = True
+            success = await async_redis_client.delete_prefix(f"{cache_type}:")
         
         return {
             "status": "success" if success else "failed",
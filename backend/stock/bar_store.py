@@ -0,0 +1,208 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from loguru import logger
+from config import BAR_STORE_DIR
+
+# 日线列定义：trade_date以"自1970-01-01起的天数"存为int32，价格存为float64，成交量存为int64
+DATE_COLUMN = "trade_date"
+PRICE_COLUMNS = ["open", "high", "low", "close", "vol"]
+COLUMN_DTYPES = {"open": np.float64, "high": np.float64, "low": np.float64, "close": np.float64, "vol": np.int64}
+META_FILE = "meta.json"
+STATE_SUFFIX = ".state.json"  # 指标递推状态文件后缀（如macd_12_26_9.state.json）
+# 被替换的旧版本数据目录保留时间（秒），期间仍持有旧元数据的读者可以读完
+STALE_VERSION_SECONDS = 300
+
+
+class BarStore:
+    """
+    本地列式日线存储（每只股票一个目录，每列一个可内存映射的.npy文件）
+    每次写入生成一个新版本子目录，最后用一次 os.replace 替换元数据（meta.json中的version）切换版本，
+    读者始终看到完整的某一版本
+    """
+    def __init__(self, root=BAR_STORE_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self._locks = {}  # ts_code -> 该股票的元数据锁（切换版本/刷新更新时间互斥）
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, ts_code: str) -> threading.Lock:
+        """获取股票的元数据锁"""
+        with self._locks_guard:
+            return self._locks.setdefault(ts_code, threading.Lock())
+
+    def _ticker_dir(self, ts_code: str) -> str:
+        return os.path.join(self.root, ts_code)
+
+    def _data_dir(self, ts_code: str, meta: dict) -> str:
+        """元数据对应版本的数据目录"""
+        return os.path.join(self._ticker_dir(ts_code), meta["version"])
+
+    def exists(self, ts_code: str) -> bool:
+        """判断股票日线是否已落盘"""
+        return os.path.exists(os.path.join(self._ticker_dir(ts_code), META_FILE))
+
+    def read_meta(self, ts_code: str) -> dict:
+        """读取股票日线元数据（版本/行数/最后交易日/更新时间），不存在返回None"""
+        try:
+            with open(os.path.join(self._ticker_dir(ts_code), META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def is_fresh(self, ts_code: str, max_age: int) -> bool:
+        """判断本地日线是否在有效期内"""
+        meta = self.read_meta(ts_code)
+        return bool(meta) and time.time() - meta.get("updated_at", 0) < max_age
+
+    def read_columns(self, ts_code: str, columns: list = None, meta: dict = None) -> dict:
+        """
+        以内存映射方式读取指定列（零拷贝）
+        :param ts_code: 股票代码
+        :param columns: 列名列表（默认全部列）
+        :param meta: 日线元数据（传入时读取该元数据对应的版本，保证多次读取的一致性）
+        :return: {列名: np.memmap}
+        """
+        columns = columns or [DATE_COLUMN] + PRICE_COLUMNS
+        meta = meta or self.read_meta(ts_code)
+        if meta is None:
+            raise FileNotFoundError(f"本地无{ts_code}日线")
+        data_dir = self._data_dir(ts_code, meta)
+        return {
+            col: np.load(os.path.join(data_dir, f"{col}.npy"), mmap_mode="r")
+            for col in columns
+        }
+
+    def read(self, ts_code: str) -> pd.DataFrame:
+        """
+        读取股票日线为DataFrame（已按trade_date升序）
+        :param ts_code: 股票代码
+        :return: 日线DataFrame，不存在返回None
+        """
+        meta = self.read_meta(ts_code)
+        if meta is None:
+            return None
+        arrays = self.read_columns(ts_code, meta=meta)
+        data = {"ts_code": ts_code}
+        # 天数直接转datetime64，无需逐行解析日期字符串
+        data[DATE_COLUMN] = arrays[DATE_COLUMN].astype("datetime64[D]").astype("datetime64[ns]")
+        for col in PRICE_COLUMNS:
+            data[col] = arrays[col]
+        return pd.DataFrame(data)
+
+    def write(self, ts_code: str, df: pd.DataFrame, keep_state: bool = False) -> None:
+        """
+        全量写入股票日线（写入新版本目录，最后原子替换元数据切换版本，读者不会看到半成品）
+        :param ts_code: 股票代码
+        :param df: 日线数据（需包含trade_date/open/high/low/close/vol）
+        :param keep_state: 是否保留指标递推状态（仅追加K线时保留，历史被改写时丢弃）
+        """
+        df = df.sort_values(DATE_COLUMN).reset_index(drop=True)
+        ticker_dir = self._ticker_dir(ts_code)
+        version = f"v{uuid.uuid4().hex}"
+        data_dir = os.path.join(ticker_dir, version)
+        os.makedirs(data_dir)
+
+        days = pd.to_datetime(df[DATE_COLUMN]).to_numpy().astype("datetime64[D]").astype(np.int32)
+        np.save(os.path.join(data_dir, f"{DATE_COLUMN}.npy"), days)
+        for col in PRICE_COLUMNS:
+            values = df[col].to_numpy(dtype=np.float64)
+            if COLUMN_DTYPES[col] == np.int64:
+                values = np.rint(np.nan_to_num(values))
+            np.save(os.path.join(data_dir, f"{col}.npy"), values.astype(COLUMN_DTYPES[col]))
+
+        # 版本切换与touch互斥，避免touch用旧元数据覆盖新版本
+        with self._lock(ts_code):
+            previous = self.read_meta(ts_code)
+            if not keep_state:
+                for name in os.listdir(ticker_dir):
+                    if name.endswith(STATE_SUFFIX):
+                        try:
+                            os.remove(os.path.join(ticker_dir, name))
+                        except FileNotFoundError:
+                            pass
+
+            meta = {
+                "version": version,
+                "rows": int(len(df)),
+                "last_date": str(days[-1].astype("datetime64[D]")) if len(days) else None,
+                "updated_at": time.time()
+            }
+            # 元数据最后写入，一次 os.replace 完成版本切换
+            self._write_json(os.path.join(ticker_dir, META_FILE), meta)
+            self._remove_stale_versions(ts_code, keep={version, (previous or {}).get("version")})
+        logger.info(f"日线写入本地存储：{ts_code}，共{meta['rows']}行")
+
+    def _remove_stale_versions(self, ts_code: str, keep: set) -> None:
+        """清理已被替换且超过保留时间的旧版本（当前版本和上一版本始终保留）"""
+        ticker_dir = self._ticker_dir(ts_code)
+        expire_before = time.time() - STALE_VERSION_SECONDS
+        for name in os.listdir(ticker_dir):
+            path = os.path.join(ticker_dir, name)
+            try:
+                if name in keep or not os.path.isdir(path) or os.path.getmtime(path) > expire_before:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def append(self, ts_code: str, df: pd.DataFrame) -> int:
+        """
+        增量追加日线（仅保留晚于最后交易日的K线）
+        :param ts_code: 股票代码
+        :param df: 新增日线数据
+        :return: 实际追加的K线数量
+        """
+        existing = self.read(ts_code)
+        if existing is None:
+            self.write(ts_code, df)
+            return len(df)
+
+        df = df.copy()
+        df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN])
+        new_bars = df[df[DATE_COLUMN] > existing[DATE_COLUMN].iloc[-1]] if len(existing) else df
+        if new_bars.empty:
+            self.touch(ts_code)
+            return 0
+
+        self.write(ts_code, pd.concat([existing, new_bars[existing.columns]], ignore_index=True), keep_state=True)
+        return len(new_bars)
+
+    def touch(self, ts_code: str) -> None:
+        """刷新更新时间（已同步但无新K线时调用）"""
+        with self._lock(ts_code):
+            meta = self.read_meta(ts_code)
+            if meta is None:
+                return
+            meta["updated_at"] = time.time()
+            self._write_json(os.path.join(self._ticker_dir(ts_code), META_FILE), meta)
+
+    def read_state(self, ts_code: str, name: str) -> dict:
+        """读取股票的指标递推状态，不存在返回None"""
+        try:
+            with open(os.path.join(self._ticker_dir(ts_code), f"{name}{STATE_SUFFIX}"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_state(self, ts_code: str, name: str, state: dict) -> None:
+        """保存股票的指标递推状态（与日线存放在同一目录）"""
+        ticker_dir = self._ticker_dir(ts_code)
+        if os.path.isdir(ticker_dir):
+            self._write_json(os.path.join(ticker_dir, f"{name}{STATE_SUFFIX}"), state)
+
+    @staticmethod
+    def _write_json(path: str, data: dict) -> None:
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+# 初始化本地日线存储单例
+bar_store = BarStore()
@@ -0,0 +1,163 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from loguru import logger
+from dotenv import load_dotenv
+from stock.stock_selector import stock_selector
+
+# 加载环境变量
+load_dotenv()
+
+# 数值K线窗口长度（最近N根K线）
+KLINE_WINDOW = int(os.getenv("KLINE_WINDOW", 60))
+# 窗口之前额外参与MACD递推的K线数（让EMA充分收敛）
+MACD_WARMUP_BARS = 200
+# 批量写入Chroma的分块大小
+UPSERT_CHUNK = 500
+
+# 特征块：每块各占窗口长度的维度，块内标准化后等权拼接
+FEATURE_BLOCKS = ("returns", "range", "body", "volume", "macd")
+
+
+class KlineWindowIndex:
+    """
+    数值K线窗口向量（不渲染图片、不经过CLIP）：
+    最近N根K线的 收益率/振幅/实体/成交量分布/MACD柱 标准化后拼接为一个单位向量，存入独立的Chroma集合
+    """
+    def __init__(self, window: int = KLINE_WINDOW, collection_name: str = "kline_window_features"):
+        self.window = window
+        self.collection_name = collection_name
+        self.dim = window * len(FEATURE_BLOCKS)
+        self._collection = None
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        """向量集合（首次使用时初始化ChromaDB，余弦距离）"""
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    import chromadb
+                    client = chromadb.PersistentClient(path=os.getenv("CHROMA_PATH"), tenant="default_tenant")
+                    self._collection = client.get_or_create_collection(
+                        name=self.collection_name,
+                        embedding_function=None,  # 直接写入数值向量，不需要嵌入函数
+                        metadata={"description": f"最近{self.window}根K线的数值特征向量", "hnsw:space": "cosine"}
+                    )
+        return self._collection
+
+    @staticmethod
+    def _standardize(block: np.ndarray) -> np.ndarray:
+        """按列（每只股票）z-score标准化，常数列置0"""
+        mean = block.mean(axis=0, keepdims=True)
+        std = block.std(axis=0, keepdims=True)
+        return np.divide(block - mean, std, out=np.zeros_like(block), where=std > 1e-12)
+
+    def embed_frames(self, frames: dict) -> dict:
+        """
+        批量计算多只股票的窗口向量（面板向量化计算）
+        :param frames: {股票代码: 日线DataFrame（按trade_date升序）}
+        :return: {股票代码: (float32单位向量, 窗口最后交易日)}，K线不足window+1根的股票跳过
+        """
+        history = self.window + 1 + MACD_WARMUP_BARS
+        codes = [ts for ts, df in frames.items() if df is not None and len(df) > self.window]
+        if not codes:
+            return {}
+
+        # 各列组装为 (交易日 × 股票) 面板，右对齐，只取窗口计算所需的尾部
+        panels = {}
+        for col in ("open", "high", "low", "close", "vol"):
+            panels[col], lengths = stock_selector.build_close_panel(
+                [frames[ts][col].to_numpy(dtype=np.float64)[-history:] for ts in codes]
+            )
+        close, open_, high, low, vol = (panels[c] for c in ("close", "open", "high", "low", "vol"))
+        macd = stock_selector.calculate_macd_panel(close, tail=self.window)["macd"]
+
+        n = self.window
+        last_close = close[-n:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            blocks = {
+                "returns": np.log(close[-n:] / close[-n - 1:-1]),
+                "range": (high[-n:] - low[-n:]) / last_close,
+                "body": (close[-n:] - open_[-n:]) / last_close,
+                "volume": np.log1p(vol[-n:] / np.nanmean(vol[-n:], axis=0, keepdims=True)),
+                # MACD柱按价格缩放，不同价位的股票可比
+                "macd": macd / last_close
+            }
+        features = np.concatenate(
+            [self._standardize(np.nan_to_num(blocks[name], nan=0.0, posinf=0.0, neginf=0.0)) for name in FEATURE_BLOCKS]
+        )
+        norms = np.linalg.norm(features, axis=0)
+        features = np.divide(features, norms, out=np.zeros_like(features), where=norms > 0).astype(np.float32)
+
+        result = {}
+        for col, ts_code in enumerate(codes):
+            if norms[col] > 0:
+                end_date = pd.Timestamp(frames[ts_code]["trade_date"].iloc[-1]).strftime("%Y-%m-%d")
+                result[ts_code] = (features[:, col], end_date)
+        return result
+
+    def embed(self, df: pd.DataFrame) -> np.ndarray:
+        """计算单只股票的窗口向量，K线不足时返回None"""
+        vectors = self.embed_frames({"_": df})
+        return vectors["_"][0] if vectors else None
+
+    def index(self, ts_codes: list = None) -> int:
+        """
+        批量计算股票池的窗口向量并写入Chroma（存在则更新）
+        :param ts_codes: 股票代码列表（默认全部A股）
+        :return: 写入的向量数量
+        """
+        if ts_codes is None:
+            ts_codes = [s["ts_code"] for s in stock_selector.get_stock_list()]
+        frames = stock_selector.get_daily_data_many(ts_codes)
+        vectors = self.embed_frames(frames)
+
+        items = list(vectors.items())
+        for i in range(0, len(items), UPSERT_CHUNK):
+            chunk = items[i:i + UPSERT_CHUNK]
+            self.collection.upsert(
+                ids=[ts_code for ts_code, _ in chunk],
+                embeddings=[vector.tolist() for _, (vector, _) in chunk],
+                metadatas=[{"ts_code": ts_code, "end_date": end_date, "window": self.window} for ts_code, (_, end_date) in chunk],
+                documents=[f"{ts_code} 截至{end_date}的{self.window}日K线走势" for ts_code, (_, end_date) in chunk]
+            )
+        logger.info(f"数值K线向量写入完成：{len(items)}/{len(ts_codes)}只股票，窗口{self.window}日")
+        return len(items)
+
+    def similar(self, ts_code: str, n_results: int = 3) -> list:
+        """
+        检索与指定股票最近K线走势相似的股票（只读日线，不渲染、不经过CLIP）
+        :param ts_code: 股票代码
+        :param n_results: 返回数量
+        :return: [{"股票代码", "相似度", "分析"}]，相似度为余弦距离（越小越相似）
+        """
+        if self.collection.count() == 0:
+            logger.warning(f"数值K线窗口向量集合为空，{ts_code}无相似K线参考，请先运行 python sync_daily.py --index-windows")
+            return []
+        df = stock_selector.get_daily_data(ts_code)
+        vector = self.embed(df) if df is not None else None
+        if vector is None:
+            return []
+
+        results = self.collection.query(
+            query_embeddings=[vector.tolist()],
+            n_results=n_results + 1,  # 多取一条，排除自身
+            include=["metadatas", "documents", "distances"]
+        )
+        similar = []
+        for idx, distance in enumerate(results["distances"][0]):
+            metadata = results["metadatas"][0][idx]
+            if metadata.get("ts_code") == ts_code or distance >= 1.0:
+                continue
+            similar.append({
+                "股票代码": metadata.get("ts_code"),
+                "相似度": round(float(distance), 4),
+                "分析": results["documents"][0][idx]
+            })
+        return similar[:n_results]
+
+
+# 初始化数值K线向量索引单例
+kline_window_index = KlineWindowIndex()
@@ -1,10 +1,17 @@
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import mplfinance as mpf
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import io
 import os
-from PIL import Image
-from cache.redis_client import redis_client
+import threading
+from loguru import logger
+from cache.redis_client import redis_client, async_redis_client
+from stock.kline_renderer import render_kline, encode_image_bytes, IMAGE_MIME, IMAGE_EXT
+from config import KLINE_IMAGE_PROFILES
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -19,26 +26,212 @@ plt.rcParams['font.sans-serif'] = [
 ]
 plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 
+# 渲染进程数（0表示在本进程的单个渲染线程中渲染）
+KLINE_RENDER_WORKERS = int(os.getenv("KLINE_RENDER_WORKERS", 0))
+# K线图只展示最近30根K线，发给渲染进程的数据也只取这么多
+KLINE_BARS = 30
+OHLCV_COLUMNS = ["open", "high", "low", "close", "vol"]
+
+def pack_bars(df: pd.DataFrame) -> tuple:
+    """
+    将日线压缩为紧凑数组（跨进程传输，避免序列化整个DataFrame）
+    :return: (交易日天数 int32数组, OHLCV float32矩阵 (K线数, 5))
+    """
+    df = df.tail(KLINE_BARS)
+    dates = pd.to_datetime(df['trade_date']).to_numpy().astype('datetime64[D]').astype(np.int32)
+    return dates, df[OHLCV_COLUMNS].to_numpy(dtype=np.float32)
+
+def unpack_bars(dates: np.ndarray, ohlcv: np.ndarray) -> pd.DataFrame:
+    """pack_bars的逆操作"""
+    df = pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS)
+    df.insert(0, 'trade_date', dates.astype('datetime64[D]').astype('datetime64[ns]'))
+    return df
+
+def _init_render_worker(renderer: str) -> None:
+    """渲染进程初始化：预先渲染一张图，加载字体/样式并建好图表模板"""
+    dates = np.arange(KLINE_BARS, dtype=np.int32) + 19000
+    ohlcv = np.ones((KLINE_BARS, 5), dtype=np.float32)
+    _render_task("WARMUP", dates, ohlcv, renderer, tuple(KLINE_IMAGE_PROFILES))
+
+def _render_task(ts_code: str, dates: np.ndarray, ohlcv: np.ndarray, renderer: str, profiles: tuple) -> dict:
+    """渲染进程任务：还原日线并按编码配置渲染"""
+    return kline_generator.render_images(ts_code, unpack_bars(dates, ohlcv), profiles, renderer)
+
 class KlineGenerator:
     """A股K线图生成器（修复dpi参数问题）"""
     def __init__(self):
         self.img_size = (10, 6)  # 图片尺寸 (宽, 高)
         self.dpi = 100  # 图片分辨率（移到savefig时指定）
         self.style = 'yahoo'  # K线样式
+        # 渲染方式：fast（复用图表模板，只更新蜡烛/成交量图元） / mplfinance（每次完整构建图表）
+        self.renderer = os.getenv("KLINE_RENDERER", "fast").lower()
+        # 渲染线程池：matplotlib非线程安全，固定单线程，仅用于把渲染移出事件循环
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kline-render")
+        # 渲染进程池（KLINE_RENDER_WORKERS>0时启用，吞吐随CPU核数扩展）
+        self.render_workers = KLINE_RENDER_WORKERS
+        self._pool = None
+        self._pool_lock = threading.Lock()  # 启动预热与/ready预热可能并发创建进程池
+
+    @property
+    def render_pool(self) -> ProcessPoolExecutor:
+        """渲染进程池（首次使用时创建；spawn启动，不继承父进程的线程/事件循环状态）"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.render_workers,
+                    mp_context=mp.get_context("spawn"),
+                    initializer=_init_render_worker,
+                    initargs=(self.renderer,)
+                )
+                logger.info(f"K线渲染进程池已启动：{self.render_workers}个进程，渲染方式{self.renderer}")
+            return self._pool
+
+    def start_render_pool(self) -> None:
+        """预热渲染进程池（等待所有进程完成初始化），未启用进程池时预热渲染线程的模板"""
+        if self.render_workers <= 0:
+            # 图表模板按线程保存，需在实际执行渲染的渲染线程中预热
+            self._executor.submit(_init_render_worker, self.renderer).result()
+            return
+        # 每个进程启动时已在初始化函数中预热，这里提交一轮空任务等待所有进程就绪
+        futures = [self.render_pool.submit(os.getpid) for _ in range(self.render_workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self) -> None:
+        """关闭渲染进程池"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    @staticmethod
+    def image_mime(profile: str = "web") -> str:
+        """编码配置对应的MIME类型"""
+        fmt = KLINE_IMAGE_PROFILES[profile]["format"]
+        return IMAGE_MIME[{"jpg": "jpeg"}.get(fmt, fmt)]
+
+    @staticmethod
+    def image_ext(profile: str = "web") -> str:
+        """编码配置对应的文件扩展名"""
+        fmt = KLINE_IMAGE_PROFILES[profile]["format"]
+        return IMAGE_EXT[{"jpg": "jpeg"}.get(fmt, fmt)]
+
+    @staticmethod
+    def image_date(df: pd.DataFrame) -> str:
+        """K线图的截止交易日（YYYYMMDD），同一股票同一截止日的图片内容不变"""
+        return pd.Timestamp(df['trade_date'].iloc[-1]).strftime("%Y%m%d") if len(df) else ""
+
+    def image_url(self, ts_code: str, df: pd.DataFrame, profile: str = "web") -> str:
+        """
+        K线图图片地址（按截止交易日寻址，浏览器可长期缓存）
+        :return: 如 /kline/sh.600000.png?date=20240614
+        """
+        url = f"/kline/{ts_code}.{self.image_ext(profile)}?date={self.image_date(df)}"
+        return url if profile == "web" else f"{url}&profile={profile}"
+
+    @staticmethod
+    def _cache_keys(ts_code: str, date: str, profiles: tuple) -> dict:
+        """各编码配置的图片缓存键（包含截止交易日）"""
+        return {profile: f"kline:image:{ts_code}:{date}:{profile}" for profile in profiles}
+
+    async def get_cached_image(self, ts_code: str, date: str, profile: str = "web") -> bytes:
+        """
+        读取已缓存的K线图（不渲染）
+        :param date: 截止交易日（YYYYMMDD）
+        :return: 图片二进制数据，未缓存时返回None
+        """
+        return await async_redis_client.get_cache(self._cache_keys(ts_code, date, (profile,))[profile], "bytes")
 
-    def generate_kline(self, ts_code: str, df: pd.DataFrame) -> bytes:
+    async def generate_kline_images_async(self, ts_code: str, df: pd.DataFrame, profiles: tuple = ("web", "llm")) -> dict:
         """
-        生成日K线图
+        异步生成日K线图（不阻塞事件循环）：启用进程池时发往渲染进程，否则在渲染线程中执行
         :param ts_code: 股票代码
-        :param df: 日线数据（需包含open/high/low/close/vol/trade_date）
+        :param df: 日线数据
+        :param profiles: 编码配置名（见config.KLINE_IMAGE_PROFILES）
+        :return: {编码配置名: 图片二进制数据}
+        """
+        loop = asyncio.get_running_loop()
+        if self.render_workers <= 0:
+            return await loop.run_in_executor(self._executor, self.generate_kline_images, ts_code, df, profiles)
+
+        # 优先读取缓存（有效期2小时）
+        keys = self._cache_keys(ts_code, self.image_date(df), profiles)
+        cached = await async_redis_client.get_many(list(keys.values()), "bytes")
+        images = {profile: cached[key] for profile, key in keys.items() if key in cached}
+        missing = tuple(profile for profile in profiles if profile not in images)
+        if missing:
+            try:
+                rendered = await loop.run_in_executor(
+                    self.render_pool, _render_task, ts_code, *pack_bars(df), self.renderer, missing
+                )
+            except Exception as e:
+                raise RuntimeError(f"生成K线图失败: {str(e)}")
+            await async_redis_client.set_many({keys[profile]: rendered[profile] for profile in missing}, 7200)
+            images.update(rendered)
+        return images
+
+    async def generate_kline_async(self, ts_code: str, df: pd.DataFrame, profile: str = "web") -> bytes:
+        """
+        异步生成单个编码配置的日K线图
         :return: 图片二进制数据
         """
+        return (await self.generate_kline_images_async(ts_code, df, (profile,)))[profile]
+
+    def generate_kline_images(self, ts_code: str, df: pd.DataFrame, profiles: tuple = ("web", "llm")) -> dict:
+        """
+        生成日K线图（只渲染一次，按多个编码配置输出）
+        :param ts_code: 股票代码
+        :param df: 日线数据（需包含open/high/low/close/vol/trade_date）
+        :param profiles: 编码配置名（见config.KLINE_IMAGE_PROFILES）
+        :return: {编码配置名: 图片二进制数据}
+        """
         # 优先读取缓存（有效期2小时）
-        cache_key = f"kline:image:{ts_code}"
-        cached_img = redis_client.get_cache(cache_key, "bytes")
-        if cached_img:
-            return cached_img
-        
+        keys = self._cache_keys(ts_code, self.image_date(df), profiles)
+        cached = redis_client.get_many(list(keys.values()), "bytes")
+        images = {profile: cached[key] for profile, key in keys.items() if key in cached}
+        missing = tuple(profile for profile in profiles if profile not in images)
+        if missing:
+            try:
+                rendered = self.render_images(ts_code, df, missing)
+            except Exception as e:
+                raise RuntimeError(f"生成K线图失败: {str(e)}")
+            # 缓存图片到Redis（7200秒=2小时）
+            redis_client.set_many({keys[profile]: rendered[profile] for profile in missing}, 7200)
+            images.update(rendered)
+        return images
+
+    def render_images(self, ts_code: str, df: pd.DataFrame, profiles: tuple, renderer: str = None) -> dict:
+        """
+        渲染K线图并按编码配置输出（不读写缓存）
+        :param renderer: 渲染方式（默认self.renderer）
+        :return: {编码配置名: 图片二进制数据}
+        """
+        configs = [KLINE_IMAGE_PROFILES[profile] for profile in profiles]
+        if (renderer or self.renderer) == "fast":
+            images = self.render_fast(ts_code, df, configs)
+        else:
+            png = self.render_mplfinance(ts_code, df)
+            images = [encode_image_bytes(png, config) for config in configs]
+        return dict(zip(profiles, images))
+
+    def render_fast(self, ts_code: str, df: pd.DataFrame, configs: list = None) -> list:
+        """
+        使用复用的图表模板渲染（绘制一次，直接从像素缓冲区按各编码配置编码）
+        :param ts_code: 股票代码
+        :param df: 日线数据
+        :param configs: 编码配置列表（默认web配置）
+        :return: 与configs一一对应的图片二进制数据
+        """
+        configs = configs or [KLINE_IMAGE_PROFILES["web"]]
+        return render_kline(f'{ts_code} 日K线图（近30天）', df.tail(30), configs, self.img_size, self.dpi)
+
+    def render_mplfinance(self, ts_code: str, df: pd.DataFrame) -> bytes:
+        """
+        使用mplfinance完整构建图表并渲染（原渲染方式）
+        :param ts_code: 股票代码
+        :param df: 日线数据
+        :return: 图片二进制数据
+        """
         try:
             # ===================== 数据预处理（原有逻辑保留） =====================
             df_kline = df.copy()
@@ -74,36 +267,20 @@ class KlineGenerator:
                 format='PNG',
                 dpi=self.dpi,  # 在这里指定分辨率，而非mpf.plot中
                 bbox_inches='tight',  # 去除白边
-                pad_inches=0.1  # 轻微内边距
-            )
-            img_buffer.seek(0)  # 重置缓冲区指针到开头
-
-            # ===================== 图片压缩（原有逻辑保留） =====================
-            img = Image.open(img_buffer)
-            img = img.convert('RGB')  # 转为RGB格式（避免透明通道问题）
-            # 保存为压缩后的二进制
-            img_byte_arr = io.BytesIO()
-            img.save(
-                img_byte_arr,
-                format='PNG',
-                quality=90,  # 压缩质量（1-100）
-                optimize=True  # 开启优化
+                pad_inches=0.1,  # 轻微内边距
+                facecolor='white'
             )
-            img_bytes = img_byte_arr.getvalue()
-
-            # ===================== 缓存+资源清理（原有逻辑保留） =====================
-            # 缓存图片到Redis（7200秒=2小时）
-            redis_client.set_cache(cache_key, img_bytes, 7200)
             # 强制关闭画布，释放内存（避免matplotlib内存泄漏）
             plt.close(fig)
-            return img_bytes
-        except Exception as e:
+            # 直接返回PNG，需要其他格式/尺寸时由调用方按编码配置转换（不再做无效的PNG二次编码）
+            return img_buffer.getvalue()
+        except Exception:
             # 异常时确保画布关闭，避免资源泄漏
             try:
                 plt.close('all')
             except:
                 pass
-            raise RuntimeError(f"生成K线图失败: {str(e)}")
+            raise
 
 # 初始化K线生成器实例（保持原有调用方式）
 kline_generator = KlineGenerator()
\ No newline at end of file
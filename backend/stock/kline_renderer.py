@@ -0,0 +1,176 @@
+import io
+import threading
+import numpy as np
+import pandas as pd
+from PIL import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+
+# 与mplfinance "yahoo" 样式一致的配色
+UP_COLOR = "#00b060"
+DOWN_COLOR = "#fe3032"
+WICK_COLOR = "#606060"
+VOLUME_UP_COLOR = "#4dc790"
+VOLUME_DOWN_COLOR = "#fd6b6c"
+FACE_COLOR = "#fafafa"
+GRID_COLOR = "#d0d0d0"
+TEXT_COLOR = "#101010"
+
+# 图片格式 → MIME类型 / 文件扩展名
+IMAGE_MIME = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+IMAGE_EXT = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+CANDLE_WIDTH = 0.6  # 蜡烛实体宽度（K线间距为1）
+VOLUME_WIDTH = 0.9  # 成交量柱宽度
+
+
+def encode_image(image: Image.Image, profile: dict) -> bytes:
+    """
+    按编码配置一次性输出图片（缩放 + 编码）
+    :param image: PIL图片
+    :param profile: {"format": png/webp/jpeg, "quality": 压缩质量, "width": 目标宽度（0为原尺寸）}
+    :return: 图片二进制数据
+    """
+    fmt = {"jpg": "jpeg"}.get(profile.get("format", "png"), profile.get("format", "png"))
+    if fmt not in IMAGE_MIME:
+        raise RuntimeError(f"不支持的图片格式: {fmt}，可选{','.join(IMAGE_MIME)}")
+    image = image.convert("RGB")  # 图表无透明区域，去掉alpha通道
+    width = profile.get("width") or 0
+    if 0 < width < image.width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    if fmt == "png":
+        image.save(buffer, format="PNG", compress_level=6)
+    elif fmt == "webp":
+        image.save(buffer, format="WEBP", quality=profile.get("quality", 80), method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=profile.get("quality", 85), optimize=True)
+    return buffer.getvalue()
+
+
+def encode_image_bytes(image_bytes: bytes, profile: dict) -> bytes:
+    """将已编码的图片按编码配置重新编码（原样满足配置时直接返回）"""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == "PNG" and profile.get("format") == "png" and not (0 < (profile.get("width") or 0) < image.width):
+        return image_bytes
+    return encode_image(image, profile)
+
+
+class KlineTemplate:
+    """
+    可复用的K线图模板：画布/坐标轴/样式/标签只创建一次，每次渲染只替换蜡烛和成交量图元
+    版式与 mplfinance.plot(type='candle', style='yahoo', volume=True) 保持一致
+    """
+    def __init__(self, figsize: tuple = (10, 6), dpi: int = 100, ylabel: str = "价格 (¥)", ylabel_lower: str = "成交量"):
+        self.dpi = dpi
+        self.fig = Figure(figsize=figsize, dpi=dpi, facecolor="white")
+        self.canvas = FigureCanvasAgg(self.fig)
+        grid = self.fig.add_gridspec(2, 1, height_ratios=(5, 2), hspace=0, left=0.04, right=0.9, top=0.86, bottom=0.14)
+        self.ax_price = self.fig.add_subplot(grid[0])
+        self.ax_volume = self.fig.add_subplot(grid[1], sharex=self.ax_price)
+
+        for ax, label in ((self.ax_price, ylabel), (self.ax_volume, ylabel_lower)):
+            ax.set_facecolor(FACE_COLOR)
+            ax.grid(True, color=GRID_COLOR, linestyle="-", linewidth=0.8)
+            ax.set_axisbelow(True)
+            ax.yaxis.tick_right()
+            ax.yaxis.set_label_position("right")
+            ax.set_ylabel(label, color=TEXT_COLOR)
+            ax.tick_params(colors=TEXT_COLOR)
+            for spine in ax.spines.values():
+                spine.set_color("#f0f0f0")
+        self.ax_price.tick_params(labelbottom=False)
+        self.ax_volume.ticklabel_format(axis="y", style="plain")
+        self.title = self.fig.suptitle("", fontsize="x-large", fontweight="bold", color=TEXT_COLOR)
+
+        # 图元只创建一次，渲染时替换数据
+        self.wicks = LineCollection([], colors=WICK_COLOR, linewidths=1.0)
+        self.bodies = PolyCollection([], linewidths=0.8)
+        self.volumes = PolyCollection([], linewidths=0.5)
+        self.ax_price.add_collection(self.wicks)
+        self.ax_price.add_collection(self.bodies)
+        self.ax_volume.add_collection(self.volumes)
+
+    @staticmethod
+    def _rects(x: np.ndarray, bottom: np.ndarray, top: np.ndarray, width: float) -> np.ndarray:
+        """批量生成矩形顶点，形状为 (数量, 4, 2)"""
+        half = width / 2
+        return np.stack([
+            np.column_stack([x - half, bottom]),
+            np.column_stack([x - half, top]),
+            np.column_stack([x + half, top]),
+            np.column_stack([x + half, bottom])
+        ], axis=1)
+
+    @staticmethod
+    def _date_ticks(dates: pd.DatetimeIndex) -> tuple:
+        """按周一（或每周首个交易日）取刻度，最多约8个"""
+        weeks = dates.to_period("W")
+        positions = [i for i in range(len(dates)) if i == 0 or weeks[i] != weeks[i - 1]]
+        step = max(1, int(np.ceil(len(positions) / 8)))
+        positions = positions[::step]
+        return positions, [dates[i].strftime("%b %d") for i in positions]
+
+    def render(self, title: str, df: pd.DataFrame, profiles: list) -> list:
+        """
+        渲染K线图（只绘制一次，按每个编码配置直接从像素缓冲区编码，不经过中间PNG）
+        :param title: 标题
+        :param df: 日线数据（trade_date/open/high/low/close/vol，按日期升序）
+        :param profiles: 编码配置列表（见encode_image）
+        :return: 与profiles一一对应的图片二进制数据
+        """
+        open_ = df["open"].to_numpy(dtype=np.float64)
+        high = df["high"].to_numpy(dtype=np.float64)
+        low = df["low"].to_numpy(dtype=np.float64)
+        close = df["close"].to_numpy(dtype=np.float64)
+        vol = df["vol"].to_numpy(dtype=np.float64)
+        x = np.arange(len(df), dtype=np.float64)
+
+        up = close >= open_
+        candle_colors = np.where(up, UP_COLOR, DOWN_COLOR)
+        # 成交量颜色按收盘价相对前一日涨跌（与mplfinance的volume默认规则一致）
+        prev_close = np.concatenate([[close[0]], close[:-1]]) if len(close) else close
+        volume_colors = np.where(close >= prev_close, VOLUME_UP_COLOR, VOLUME_DOWN_COLOR)
+
+        self.wicks.set_segments(np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1))
+        self.bodies.set_verts(self._rects(x, np.minimum(open_, close), np.maximum(open_, close), CANDLE_WIDTH))
+        self.bodies.set_facecolors(candle_colors)
+        self.bodies.set_edgecolors(candle_colors)
+        self.volumes.set_verts(self._rects(x, np.zeros_like(vol), vol, VOLUME_WIDTH))
+        self.volumes.set_facecolors(volume_colors)
+        self.volumes.set_edgecolors(volume_colors)
+
+        if len(df):
+            pad = (high.max() - low.min()) * 0.05 or high.max() * 0.01 or 1.0
+            self.ax_price.set_xlim(-1, len(df))
+            self.ax_price.set_ylim(low.min() - pad, high.max() + pad)
+            self.ax_volume.set_ylim(0, vol.max() * 1.1 or 1.0)
+            positions, labels = self._date_ticks(pd.DatetimeIndex(pd.to_datetime(df["trade_date"])))
+            self.ax_volume.set_xticks(positions)
+            self.ax_volume.set_xticklabels(labels, rotation=45, ha="right")
+        self.title.set_text(title)
+
+        self.canvas.draw()
+        image = Image.fromarray(np.asarray(self.canvas.buffer_rgba()))
+        return [encode_image(image, profile) for profile in profiles]
+
+
+# 每个线程一份模板（Figure非线程安全，模板不跨线程共享）
+_templates = threading.local()
+
+
+def render_kline(title: str, df: pd.DataFrame, profiles: list, figsize: tuple = (10, 6), dpi: int = 100) -> list:
+    """
+    使用当前线程的K线模板渲染
+    :param profiles: 编码配置列表
+    :return: 与profiles一一对应的图片二进制数据
+    """
+    key = (figsize, dpi)
+    cache = getattr(_templates, "cache", None)
+    if cache is None:
+        cache = _templates.cache = {}
+    if key not in cache:
+        cache[key] = KlineTemplate(figsize=figsize, dpi=dpi)
+    return cache[key].render(title, df, profiles)
@@ -1,3 +1,6 @@
+import atexit
+import threading
+import time
 import baostock as bs
 from loguru import logger
 import pandas as pd
@@ -5,10 +8,94 @@ import numpy as np
 from dotenv import load_dotenv
 import os
 from cache.redis_client import redis_client
+from stock.bar_store import bar_store
+from stock.universe_fetcher import universe_fetcher
 
 # 加载环境变量
 load_dotenv()
 
+class BaostockSession:
+    """Baostock会话管理器：每个进程登录一次并复用会话，会话失效时自动重新登录"""
+    # 需要重新登录的错误码（用户未登录 / 网络连接断开）
+    RELOGIN_ERROR_CODES = {"10001001", "10002007"}
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Baostock使用模块级全局连接，查询需串行
+        self._pid = None  # 登录时所在进程（fork出的子进程需重新登录）
+        self.rate_limiter = None  # 可选的全局限速器（由多进程拉取器注入）
+        self.login_count = 0
+        self.query_count = 0
+        self.query_errors = 0
+        self.total_query_time = 0.0
+        self.max_query_time = 0.0
+
+    def _login(self) -> None:
+        lg = bs.login()
+        if lg.error_code != '0':
+            self._pid = None
+            raise RuntimeError(f"Baostock登录失败: {lg.error_msg}")
+        self._pid = os.getpid()
+        self.login_count += 1
+        logger.info(f"Baostock登录成功（累计登录{self.login_count}次）")
+
+    def _ensure_login(self) -> None:
+        if self._pid != os.getpid():
+            self._login()
+
+    def query(self, query_func, **kwargs) -> list:
+        """
+        执行Baostock查询并读取全部结果行（会话失效时重新登录并重试一次）
+        :param query_func: Baostock查询函数（如bs.query_history_k_data_plus）
+        :param kwargs: 查询参数
+        :return: 结果行列表
+        """
+        with self._lock:
+            for attempt in range(2):
+                self._ensure_login()
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                start = time.perf_counter()
+                rs = query_func(**kwargs)
+                rows = []
+                while (rs.error_code == '0') & rs.next():
+                    rows.append(rs.get_row_data())
+                elapsed = time.perf_counter() - start
+
+                self.query_count += 1
+                self.total_query_time += elapsed
+                self.max_query_time = max(self.max_query_time, elapsed)
+
+                if rs.error_code == '0':
+                    return rows
+                self.query_errors += 1
+                if rs.error_code in self.RELOGIN_ERROR_CODES and attempt == 0:
+                    logger.warning(f"Baostock会话失效（{rs.error_msg}），重新登录")
+                    self._pid = None
+                    continue
+                raise RuntimeError(f"Baostock查询失败: {rs.error_msg}")
+
+    def logout(self) -> None:
+        """登出当前进程的Baostock会话"""
+        with self._lock:
+            if self._pid == os.getpid():
+                bs.logout()
+                self._pid = None
+
+    def metrics(self) -> dict:
+        """会话指标：登录次数、查询次数及耗时"""
+        return {
+            "logged_in": self._pid == os.getpid(),
+            "login_count": self.login_count,
+            "query_count": self.query_count,
+            "query_errors": self.query_errors,
+            "avg_query_ms": round(self.total_query_time / self.query_count * 1000, 2) if self.query_count else 0.0,
+            "max_query_ms": round(self.max_query_time * 1000, 2)
+        }
+
+# 初始化Baostock会话单例（进程退出时登出）
+baostock_session = BaostockSession()
+atexit.register(baostock_session.logout)
+
 class MACDStockSelector:
     """基于MACD金叉的A股选股器（Baostock版）"""
     def __init__(self):
@@ -18,6 +105,7 @@ class MACDStockSelector:
         self.slow_period = int(os.getenv("MACD_SLOW", 26))
         self.signal_period = int(os.getenv("MACD_SIGNAL", 9))
         self.max_stocks = int(os.getenv("STOCK_LIMIT", 50))  # 替换TUSHARE_LIMIT为STOCK_LIMIT
+        self.bar_store_ttl = int(os.getenv("BAR_STORE_TTL", 14400))  # 本地日线有效期（默认4小时）
 
     def calculate_macd(self, df: pd.DataFrame) -> pd.DataFrame:
         """计算MACD指标（逻辑不变）"""
@@ -30,6 +118,178 @@ class MACDStockSelector:
         
         return df
 
+    @staticmethod
+    def _ema_alpha(span: int) -> float:
+        """与pandas ewm(span=..., adjust=False)一致的平滑系数"""
+        return 2.0 / (span + 1.0)
+
+    def macd_params(self, fast: int = None, slow: int = None, signal: int = None) -> tuple:
+        """
+        解析MACD参数（未传入的使用默认值）
+        说明：参数只在调用链中显式传递，不写回self，多个线程以不同参数并发选股时互不影响
+        :return: (快速周期, 慢速周期, 信号周期)
+        """
+        return (fast or self.fast_period, slow or self.slow_period, signal or self.signal_period)
+
+    @staticmethod
+    def macd_state_name(params: tuple) -> str:
+        """MACD参数对应的递推状态名（每组参数单独保存状态）"""
+        return "macd_{}_{}_{}".format(*params)
+
+    def build_close_panel(self, closes: list) -> tuple:
+        """
+        将多只股票的收盘价组装为 (交易日 × 股票) 的NumPy面板
+        :param closes: 收盘价数组列表（每只股票按trade_date升序）
+        :return: (面板, 每只股票的K线数量)
+        说明：各股票按"最近一根K线"右对齐，上方不足部分填NaN，
+        这样每列的递推只覆盖该股票自身的K线序列，与逐只计算的结果一致。
+        """
+        lengths = np.array([len(close) for close in closes], dtype=np.int64)
+        rows = int(lengths.max()) if len(lengths) else 0
+        panel = np.full((rows, len(closes)), np.nan, dtype=np.float64)
+        for col, close in enumerate(closes):
+            if lengths[col]:
+                panel[rows - lengths[col]:, col] = np.asarray(close, dtype=np.float64)
+        return panel, lengths
+
+    def calculate_macd_panel(self, panel: np.ndarray, tail: int = 2, init: dict = None, params: tuple = None) -> dict:
+        """
+        向量化计算整个面板的MACD（所有股票一次递推）
+        :param panel: build_close_panel生成的收盘价面板
+        :param tail: 保留最后几根K线的指标（默认2，供金叉判断使用）
+        :param init: 递推初始状态 {"ema_fast"/"ema_slow"/"dea": 每只股票的值，NaN表示从头计算}
+        :param params: MACD参数（见macd_params，默认使用默认参数）
+        :return: {"dif"/"dea"/"macd"/"close": 形状为(tail, 股票数)的数组（无K线处为NaN），
+                  "state": 递推结束时的状态（格式同init）}
+        """
+        rows, cols = panel.shape
+        fast, slow, signal = params or self.macd_params()
+        a_fast = self._ema_alpha(fast)
+        a_slow = self._ema_alpha(slow)
+        a_signal = self._ema_alpha(signal)
+
+        init = init or {}
+        ema_fast = np.array(init.get("ema_fast", np.full(cols, np.nan)), dtype=np.float64)
+        ema_slow = np.array(init.get("ema_slow", np.full(cols, np.nan)), dtype=np.float64)
+        dea = np.array(init.get("dea", np.full(cols, np.nan)), dtype=np.float64)
+        out = {name: np.full((tail, cols), np.nan) for name in ("dif", "dea", "macd", "close")}
+
+        for t in range(rows):
+            close = panel[t]
+            valid = ~np.isnan(close)  # 右对齐填充的NaN行保持原状态
+            # 首根有效K线作为EMA初值，与ewm(adjust=False)的起点一致
+            ema_fast = np.where(valid, np.where(np.isnan(ema_fast), close, a_fast * close + (1 - a_fast) * ema_fast), ema_fast)
+            ema_slow = np.where(valid, np.where(np.isnan(ema_slow), close, a_slow * close + (1 - a_slow) * ema_slow), ema_slow)
+            dif = ema_fast - ema_slow
+            dea = np.where(valid, np.where(np.isnan(dea), dif, a_signal * dif + (1 - a_signal) * dea), dea)
+
+            pos = t - rows + tail
+            if pos >= 0:
+                out["dif"][pos] = np.where(valid, dif, np.nan)
+                out["dea"][pos] = np.where(valid, dea, np.nan)
+                out["macd"][pos] = np.where(valid, 2 * (dif - dea), np.nan)
+                out["close"][pos] = close
+        out["state"] = {"ema_fast": ema_fast, "ema_slow": ema_slow, "dea": dea}
+        return out
+
+    def load_macd_state(self, ts_code: str, meta: dict, params: tuple) -> dict:
+        """
+        读取股票的MACD递推状态，并校验其参数一致、对应的K线仍是当前历史的前缀
+        :param ts_code: 股票代码
+        :param meta: 日线元数据
+        :param params: MACD参数
+        :return: 有效状态，参数不符、历史被改写或状态不存在时返回None（需全量重算）
+        """
+        state = bar_store.read_state(ts_code, self.macd_state_name(params))
+        if not state or state.get("params") != list(params) or not 0 < state["rows"] <= meta["rows"]:
+            return None
+        trade_days = bar_store.read_columns(ts_code, ["trade_date"], meta)["trade_date"]
+        if int(trade_days[state["rows"] - 1]) != state["last_day"]:
+            return None
+        return state
+
+    def calculate_macd_incremental(self, ts_codes: list, metas: list, tail: int = 2, params: tuple = None) -> dict:
+        """
+        基于持久化递推状态计算多只股票的MACD：已有状态的股票只递推新增K线（O(1)/根），
+        无状态或历史被改写的股票全量重算，计算后保存新状态
+        :param ts_codes: 股票代码列表（日线需已在本地存储）
+        :param metas: 对应的日线元数据列表
+        :param tail: 保留最后几根K线的指标
+        :param params: MACD参数（见macd_params，默认使用默认参数）
+        :return: {"dif"/"dea"/"macd"/"close": 形状为(tail, 股票数)的数组}
+        """
+        params = params or self.macd_params()
+        state_name = self.macd_state_name(params)
+        cols = len(ts_codes)
+        closes, states = [], []
+        for ts_code, meta in zip(ts_codes, metas):
+            state = self.load_macd_state(ts_code, meta, params)
+            close = bar_store.read_columns(ts_code, ["close"], meta)["close"]
+            closes.append(close[state["rows"]:] if state else close)
+            states.append(state)
+
+        panel, new_rows = self.build_close_panel(closes)
+        init = {
+            key: np.array([st[key] if st else np.nan for st in states], dtype=np.float64)
+            for key in ("ema_fast", "ema_slow", "dea")
+        }
+        result = self.calculate_macd_panel(panel, tail=tail, init=init, params=params)
+
+        # 合并"状态中保存的最后tail根"与"本次新增K线"的指标，取最后tail根
+        merged = {}
+        col_idx = np.arange(cols)
+        for name in ("dif", "dea", "macd", "close"):
+            saved = np.array(
+                [st["tail"][name] if st else [np.nan] * tail for st in states], dtype=np.float64
+            ).T.reshape(tail, cols)
+            merged[name] = np.empty((tail, cols))
+            for back in range(tail):
+                # 倒数第back根：新增K线足够时取本次结果，否则顺延到状态中保存的K线
+                saved_row = np.clip(tail - 1 - (back - new_rows), 0, tail - 1)
+                merged[name][tail - 1 - back] = np.where(
+                    back < new_rows, result[name][tail - 1 - back], saved[saved_row, col_idx]
+                )
+
+        # 有新K线的股票保存新状态
+        for col, (ts_code, meta) in enumerate(zip(ts_codes, metas)):
+            if not new_rows[col] or not meta["rows"]:
+                continue
+            last_day = int(bar_store.read_columns(ts_code, ["trade_date"], meta)["trade_date"][meta["rows"] - 1])
+            bar_store.write_state(ts_code, state_name, {
+                "params": list(params),
+                "rows": meta["rows"],
+                "last_day": last_day,
+                "ema_fast": float(result["state"]["ema_fast"][col]),
+                "ema_slow": float(result["state"]["ema_slow"][col]),
+                "dea": float(result["state"]["dea"][col]),
+                "tail": {name: merged[name][:, col].tolist() for name in ("dif", "dea", "macd", "close")}
+            })
+        return merged
+
+    def gold_cross_mask(self, macd_tail: dict, lengths: np.ndarray, min_bars: int = 0, params: tuple = None) -> np.ndarray:
+        """
+        以布尔掩码形式判断整个面板的MACD金叉（与is_macd_gold_cross条件一致）
+        :param macd_tail: calculate_macd_panel的返回值
+        :param lengths: 每只股票的K线数量
+        :param min_bars: 额外的最少K线数量要求
+        :param params: MACD参数（见macd_params，默认使用默认参数）
+        :return: 每只股票是否金叉的布尔数组
+        """
+        dif, dea, macd = macd_tail["dif"], macd_tail["dea"], macd_tail["macd"]
+        if dif.shape[0] < 2:
+            return np.zeros(len(lengths), dtype=bool)
+
+        _, slow, signal = params or self.macd_params()
+        enough = lengths >= max(slow + signal, min_bars, 2)
+        with np.errstate(invalid="ignore"):
+            return (
+                enough &
+                (dif[-2] < dea[-2]) &
+                (dif[-1] > dea[-1]) &
+                (macd[-2] < 0) &
+                (macd[-1] > 0)
+            )
+
     def get_stock_list(self) -> list:
         """获取A股基础列表（Baostock版）"""
 
@@ -37,23 +297,14 @@ class MACDStockSelector:
         try:
             # 缓存A股列表（有效期1天）
             cache_key = "stock:basic_list"
-            cached_list = redis_client.get_cache(cache_key, "list")
+            cached_list = redis_client.get_cache_local(cache_key, "list")
             if cached_list:
                 return cached_list
             
-            # 初始化Baostock连接
-            lg = bs.login()
-            print(f"登录错误信息: {lg.error_msg}")
-
-            if lg.error_code != '0':
-                raise RuntimeError(f"Baostock登录失败: {lg.error_msg}")
-            
-            # 获取沪深A股列表
-            stock_rs = bs.query_stock_basic(code="", code_name="")
+            # 获取沪深A股列表（复用Baostock会话）
             logger.info("查询股票列表中...")
             stock_list = []
-            while (stock_rs.error_code == '0') & stock_rs.next():
-                row = stock_rs.get_row_data()
+            for row in baostock_session.query(bs.query_stock_basic, code="", code_name=""):
                 # 格式适配（对齐原有Tushare字段）
                 stock_list.append({
                     "ts_code": row[0],  # 股票代码（如600519.SH）
@@ -62,9 +313,6 @@ class MACDStockSelector:
                     "industry": row[2],  # 行业
                     "list_date": row[3]  # 上市日期
                 })
-            
-            # 登出Baostock
-            bs.logout()
 
             logger.info(f"获取股票总数: {len(stock_list)}")
             
@@ -78,61 +326,178 @@ class MACDStockSelector:
             logger.error(f"获取股票列表失败: {str(e)}")
             raise RuntimeError(f"获取股票列表失败: {str(e)}")
 
+    def get_trade_dates(self, start_date: str, end_date: str) -> list:
+        """
+        获取区间内的交易日（Baostock交易日历，缓存1天；查询失败时按工作日近似）
+        :param start_date: 起始日期（YYYY-MM-DD）
+        :param end_date: 结束日期（YYYY-MM-DD）
+        :return: 交易日列表（YYYY-MM-DD，升序）
+        """
+        cache_key = f"stock:trade_dates:{start_date}:{end_date}"
+        cached_dates = redis_client.get_cache_local(cache_key, "list")
+        if cached_dates:
+            return cached_dates
+        try:
+            rows = baostock_session.query(bs.query_trade_dates, start_date=start_date, end_date=end_date)
+            trade_dates = [row[0] for row in rows if row[1] == "1"]
+            redis_client.set_cache(cache_key, trade_dates, 86400)
+            return trade_dates
+        except Exception as e:
+            logger.warning(f"获取交易日历失败，按工作日近似: {str(e)}")
+            return [d.strftime("%Y-%m-%d") for d in pd.bdate_range(start_date, end_date)]
+
+    def _query_daily_bars(self, ts_code: str, start_date: str = "") -> pd.DataFrame:
+        """
+        从Baostock查询日线
+        :param ts_code: 股票代码
+        :param start_date: 起始日期（YYYY-MM-DD，空字符串表示全部历史）
+        :return: 按trade_date升序的日线DataFrame
+        """
+        # Baostock代码格式：600519.SH → sh.600519
+        bs_code = f"{ts_code.split('.')[1].lower()}.{ts_code.split('.')[0]}"
+        rows = baostock_session.query(
+            bs.query_history_k_data_plus,
+            code=bs_code,
+            fields="date,open,high,low,close,volume",
+            start_date=start_date, end_date="",
+            frequency="d", adjustflag="3"  # 3=不复权
+        )
+        
+        # 转换为DataFrame
+        daily_list = []
+        for row in rows:
+            daily_list.append({
+                "ts_code": ts_code,
+                "trade_date": row[0],
+                "open": float(row[1]) if row[1] else 0.0,
+                "high": float(row[2]) if row[2] else 0.0,
+                "low": float(row[3]) if row[3] else 0.0,
+                "close": float(row[4]) if row[4] else 0.0,
+                "vol": float(row[5]) if row[5] else 0.0
+            })
+        
+        # 转换为DataFrame并排序
+        df = pd.DataFrame(daily_list, columns=["ts_code", "trade_date", "open", "high", "low", "close", "vol"])
+        df['trade_date'] = pd.to_datetime(df['trade_date'])
+        return df.sort_values('trade_date').reset_index(drop=True)
+
+    def sync_stock_daily(self, ts_code: str) -> int:
+        """
+        同步单只股票日线：本地已有数据时只拉取最后交易日之后的K线
+        :param ts_code: 股票代码
+        :return: 新增K线数量
+        """
+        meta = bar_store.read_meta(ts_code)
+        if meta and meta.get("last_date"):
+            start_date = (pd.Timestamp(meta["last_date"]) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+            end_date = pd.Timestamp.now(tz="Asia/Shanghai").strftime("%Y-%m-%d")
+            if start_date > end_date:
+                # 本地已有今天的K线，无需查询（起始日期晚于结束日期时Baostock会报错）
+                bar_store.touch(ts_code)
+                return 0
+            df = self._query_daily_bars(ts_code, start_date)
+            added = bar_store.append(ts_code, df)
+            logger.info(f"增量同步{ts_code}：自{start_date}起新增{added}根K线")
+            return added
+
+        df = self._query_daily_bars(ts_code)
+        bar_store.write(ts_code, df)
+        logger.info(f"全量同步{ts_code}：共{len(df)}根K线")
+        return len(df)
+
+    def sync_daily_data(self, ts_codes: list = None) -> dict:
+        """
+        批量增量同步日线到本地存储（多进程并行，可作为每日定时任务运行）
+        :param ts_codes: 股票代码列表（默认全部A股）
+        :return: 同步统计 {"synced": 成功数, "failed": 失败数, "new_bars": 新增K线数}
+        """
+        if ts_codes is None:
+            ts_codes = [s['ts_code'] for s in self.get_stock_list()]
+
+        stats = {"synced": 0, "failed": 0, "new_bars": 0}
+        for ts_code, new_bars, error in universe_fetcher.fetch(ts_codes):
+            if error:
+                logger.error(f"同步{ts_code}日线失败: {error}")
+                stats["failed"] += 1
+                continue
+            stats["new_bars"] += new_bars
+            stats["synced"] += 1
+
+        logger.info(f"日线同步完成：{stats}")
+        return stats
+
     def get_daily_data(self, ts_code: str) -> pd.DataFrame:
-        """获取股票日线数据（Baostock版）"""
+        """获取股票日线数据（本地列式存储 → Redis → Baostock增量同步）"""
         try:
-            # 缓存日线数据（有效期4小时）
+            # 优先读取本地列式存储（内存映射，无需JSON解析）；热点股票直接命中进程内L1缓存
+            meta = bar_store.read_meta(ts_code)
+            age = time.time() - meta["updated_at"] if meta else None
+            if meta and age < self.bar_store_ttl:
+                # L1键包含更新时间，本地日线一旦更新旧条目自然失效
+                df = redis_client.local.get_or_load(
+                    f"stock:daily:{ts_code}@{meta['updated_at']}#frame",
+                    lambda: (bar_store.read(ts_code), self.bar_store_ttl - age)
+                )
+                return df.copy(deep=False)
+
+            # 本地无数据时先尝试Redis缓存（有效期4小时）
             cache_key = f"stock:daily:{ts_code}"
-            cached_data = redis_client.get_cache(cache_key, "dict")
-            if cached_data:
-                df = pd.DataFrame(cached_data)
-                df['trade_date'] = pd.to_datetime(df['trade_date'])
-                df = df.sort_values('trade_date').reset_index(drop=True)
-                return df
-            
-            # 初始化Baostock连接
-            lg = bs.login()
-            if lg.error_code != '0':
-                raise RuntimeError(f"Baostock登录失败: {lg.error_msg}")
+            if not bar_store.exists(ts_code):
+                df = redis_client.get_frame(cache_key)
+                if df is not None and not df.empty:
+                    bar_store.write(ts_code, df)
+                    return df
             
-            # 获取最近60天日线数据
-            # Baostock代码格式：600519.SH → sh.600519
-            bs_code = f"{ts_code.split('.')[1].lower()}.{ts_code.split('.')[0]}"
-            daily_rs = bs.query_history_k_data_plus(
-                code=bs_code,
-                fields="date,open,high,low,close,volume",
-                start_date="", end_date="",
-                frequency="d", adjustflag="3"  # 3=不复权
-            )
-            
-            # 转换为DataFrame
-            daily_list = []
-            while (daily_rs.error_code == '0') & daily_rs.next():
-                row = daily_rs.get_row_data()
-                daily_list.append({
-                    "ts_code": ts_code,
-                    "trade_date": row[0],
-                    "open": float(row[1]) if row[1] else 0.0,
-                    "high": float(row[2]) if row[2] else 0.0,
-                    "low": float(row[3]) if row[3] else 0.0,
-                    "close": float(row[4]) if row[4] else 0.0,
-                    "vol": float(row[5]) if row[5] else 0.0
-                })
-            
-            # 登出Baostock
-            bs.logout()
-            
-            # 转换为DataFrame并排序
-            df = pd.DataFrame(daily_list)
-            df['trade_date'] = pd.to_datetime(df['trade_date'])
-            df = df.sort_values('trade_date').reset_index(drop=True)
+            # 本地已有历史时只拉取新增K线，否则全量拉取（复用Baostock会话）
+            self.sync_stock_daily(ts_code)
             
             # 缓存结果
-            redis_client.set_cache(cache_key, df.to_dict('records'), 14400)
+            df = bar_store.read(ts_code)
+            redis_client.set_frame(cache_key, df, 14400)
             return df
         except Exception as e:
             raise RuntimeError(f"获取{ts_code}日线数据失败: {str(e)}")
 
+    def prefetch_daily_data(self, ts_codes: list) -> list:
+        """
+        批量准备多只股票的本地日线：本地缺失的先用MGET从Redis批量拉取，
+        仍过期的交给多进程拉取器增量同步，新同步的日线再用管道批量回写Redis
+        :param ts_codes: 股票代码列表
+        :return: 本地已有可用日线的股票代码列表（保持输入顺序）
+        """
+        stale_codes = [c for c in ts_codes if not bar_store.is_fresh(c, self.bar_store_ttl)]
+
+        # 1. 本地缺失的股票从Redis批量读取（每批一次往返）
+        missing = [c for c in stale_codes if not bar_store.exists(c)]
+        if missing:
+            cached = redis_client.get_many([f"stock:daily:{c}" for c in missing], "frame")
+            for ts_code in missing:
+                df = cached.get(f"stock:daily:{ts_code}")
+                if df is not None and not df.empty:
+                    bar_store.write(ts_code, df)
+                    stale_codes.remove(ts_code)
+
+        # 2. 其余过期股票从Baostock增量同步（多进程并行）
+        synced = {}
+        for ts_code, new_bars, error in universe_fetcher.fetch(stale_codes):
+            if error:
+                logger.warning(f"同步{ts_code}日线失败: {error}")
+                continue
+            synced[f"stock:daily:{ts_code}"] = bar_store.read(ts_code)
+
+        # 3. 新同步的日线批量回写Redis，供其他实例共享
+        if synced:
+            redis_client.set_many(synced, 14400)
+        return [c for c in ts_codes if bar_store.exists(c)]
+
+    def get_daily_data_many(self, ts_codes: list) -> dict:
+        """
+        批量获取多只股票日线
+        :param ts_codes: 股票代码列表
+        :return: {股票代码: 日线DataFrame}，获取失败的股票不包含在内
+        """
+        return {ts_code: bar_store.read(ts_code) for ts_code in self.prefetch_daily_data(ts_codes)}
+
     def is_macd_gold_cross(self, df: pd.DataFrame) -> bool:
         """判断MACD金叉（逻辑不变）"""
         if len(df) < self.slow_period + self.signal_period:
@@ -154,51 +519,50 @@ class MACDStockSelector:
         return gold_cross
 
     def select_stocks(self, fast: int = None, slow: int = None, signal: int = None) -> list:
-        """执行MACD金叉选股（逻辑不变）"""
-        if fast:
-            self.fast_period = fast
-        if slow:
-            self.slow_period = slow
-        if signal:
-            self.signal_period = signal
+        """执行MACD金叉选股（面板向量化计算，结果与逐只计算一致）"""
+        params = self.macd_params(fast, slow, signal)
         
         # 缓存选股结果（按参数缓存）
-        cache_key = f"stock:macd_select:{self.fast_period}:{self.slow_period}:{self.signal_period}"
-        cached_result = redis_client.get_cache(cache_key, "list")
-        if cached_result:
-            return cached_result
+        cache_key = "stock:macd_select:{}:{}:{}".format(*params)
+        cached_result = redis_client.get_frame(cache_key)
+        if cached_result is not None and not cached_result.empty:
+            return cached_result.to_dict('records')
         
         try:
             stock_list = self.get_stock_list()[:self.max_stocks]
-            selected_stocks = []
-            
+
+            # 1. 批量准备本地日线（Redis批量读取 + 多进程增量同步），K线不足60根的股票不参与选股
+            available = set(self.prefetch_daily_data([s['ts_code'] for s in stock_list]))
+            stocks, metas = [], []
             for stock in stock_list:
                 ts_code = stock['ts_code']
-                logger.info(f"处理股票-------------: {ts_code}")
-                try:
-                    df = self.get_daily_data(ts_code)
-                    if len(df) < 60:
-                        continue
-                    
-                    logger.info(f"计算MACD指标-------------: {ts_code}")
-                    df = self.calculate_macd(df)
-                    if self.is_macd_gold_cross(df):
-                        logger.info(f"选中股票-------------: {ts_code}")
-                        latest = df.tail(1).iloc[0]
-                        stock['dif'] = float(latest['dif'])
-                        stock['dea'] = float(latest['dea'])
-                        stock['macd'] = float(latest['macd'])
-                        stock['latest_price'] = float(latest['close'])
-                        selected_stocks.append(stock)
-                    
-                    if len(selected_stocks) >= self.max_stocks:
-                        break
-                except Exception as e:
-                    print(f"处理{ts_code}失败: {str(e)}")
+                if ts_code not in available:
+                    continue
+                meta = bar_store.read_meta(ts_code)
+                if not meta or meta["rows"] < 60:
                     continue
+                stocks.append(stock)
+                metas.append(meta)
+
+            # 2. 整个面板一次性计算MACD（有递推状态的股票只计算新增K线）并判断金叉
+            selected_stocks = []
+            if stocks:
+                logger.info(f"计算MACD指标-------------: {len(stocks)}只股票")
+                macd_tail = self.calculate_macd_incremental([s['ts_code'] for s in stocks], metas, params=params)
+                lengths = np.array([meta["rows"] for meta in metas], dtype=np.int64)
+                mask = self.gold_cross_mask(macd_tail, lengths, params=params)
+
+                for col in np.flatnonzero(mask)[:self.max_stocks]:
+                    stock = dict(stocks[col])  # 复制一份，避免改动缓存中的股票列表
+                    logger.info(f"选中股票-------------: {stock['ts_code']}")
+                    stock['dif'] = float(macd_tail['dif'][-1, col])
+                    stock['dea'] = float(macd_tail['dea'][-1, col])
+                    stock['macd'] = float(macd_tail['macd'][-1, col])
+                    stock['latest_price'] = float(macd_tail['close'][-1, col])
+                    selected_stocks.append(stock)
             
             logger.info(f"选出股票总数: {len(selected_stocks)}")
-            redis_client.set_cache(cache_key, selected_stocks, int(os.getenv("CACHE_EXPIRE", 3600)))
+            redis_client.set_frame(cache_key, pd.DataFrame(selected_stocks), int(os.getenv("CACHE_EXPIRE", 3600)))
             
             logger.info("MACD选股完成--------------------------")
             return selected_stocks
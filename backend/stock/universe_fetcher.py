@@ -0,0 +1,108 @@
+import multiprocessing as mp
+import os
+import threading
+import time
+from loguru import logger
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 工作进程以spawn方式启动：调用方常在多线程的Web进程中，fork会复制其他线程持有的锁（日志/Redis连接池等）导致死锁
+_mp_context = mp.get_context("spawn")
+
+
+class RateLimiter:
+    """跨进程共享的请求速率限制器（按固定间隔依次发放请求时隙）"""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = _mp_context.Value('d', 0.0)  # 下一个可用时隙（所有进程共享）
+
+    def acquire(self) -> None:
+        """阻塞直到获得一个请求时隙"""
+        if not self.interval:
+            return
+        with self._next_slot.get_lock():
+            slot = max(time.monotonic(), self._next_slot.value)
+            self._next_slot.value = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _init_worker(rate_limiter: RateLimiter) -> None:
+    """工作进程初始化：独立的Baostock会话 + 共享限速器"""
+    from stock.stock_selector import baostock_session
+    baostock_session.rate_limiter = rate_limiter
+
+
+def _sync_task(ts_code: str) -> tuple:
+    """工作进程任务：增量同步单只股票日线"""
+    from stock.stock_selector import stock_selector
+    try:
+        return ts_code, stock_selector.sync_stock_daily(ts_code), None
+    except Exception as e:
+        return ts_code, 0, str(e)
+
+
+class UniverseFetcher:
+    """多进程日线拉取器（每个进程持有独立Baostock会话，全局统一限速）"""
+    def __init__(self, workers: int = None, rate: float = None):
+        self.workers = workers or int(os.getenv("FETCH_WORKERS", os.cpu_count() or 1))
+        self.rate = rate if rate is not None else float(os.getenv("BAOSTOCK_RPS", 10))
+        self._rate_limiter = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        """全局限速器（首次使用时创建，工作进程导入本模块时不会各自创建共享内存）"""
+        if self._rate_limiter is None:
+            with self._lock:
+                if self._rate_limiter is None:
+                    self._rate_limiter = RateLimiter(self.rate)
+        return self._rate_limiter
+
+    @property
+    def pool(self):
+        """拉取进程池（首次使用时创建并复用，每个进程只登录一次Baostock）"""
+        if self._pool is None:
+            rate_limiter = self.rate_limiter
+            with self._lock:
+                if self._pool is None:
+                    logger.info(f"启动{self.workers}个日线拉取进程，限速{self.rate}次/秒")
+                    self._pool = _mp_context.Pool(
+                        processes=self.workers, initializer=_init_worker, initargs=(rate_limiter,)
+                    )
+        return self._pool
+
+    def shutdown(self) -> None:
+        """关闭拉取进程池"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def fetch(self, ts_codes: list):
+        """
+        并行同步多只股票日线到本地存储，结果按完成顺序流式返回
+        :param ts_codes: 股票代码列表
+        :return: 生成器，逐个产出 (股票代码, 新增K线数, 错误信息或None)
+        """
+        workers = min(self.workers, len(ts_codes))
+        if workers <= 1:
+            # 单进程直接在当前进程执行，省去进程池开销
+            from stock.stock_selector import baostock_session
+            baostock_session.rate_limiter = self.rate_limiter
+            for ts_code in ts_codes:
+                yield _sync_task(ts_code)
+            return
+
+        logger.info(f"多进程拉取{len(ts_codes)}只股票日线")
+        for result in self.pool.imap_unordered(_sync_task, ts_codes):
+            yield result
+
+
+# 初始化多进程拉取器单例
+universe_fetcher = UniverseFetcher()
@@ -0,0 +1,20 @@
+import argparse
+from loguru import logger
+from stock.stock_selector import stock_selector
+
+# 日线增量同步任务（建议收盘后通过cron等定时运行）
+# 用法：python sync_daily.py                    # 同步全部A股
+#      python sync_daily.py sh.600000 ...       # 同步指定股票
+#      python sync_daily.py --index-windows     # 同步后重建数值K线窗口向量（相似K线检索用）
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量同步A股日线到本地列式存储")
+    parser.add_argument("ts_codes", nargs="*", help="股票代码（默认全部A股）")
+    parser.add_argument("--index-windows", action="store_true", help="同步后批量计算数值K线窗口向量并写入Chroma")
+    args = parser.parse_args()
+
+    stats = stock_selector.sync_daily_data(args.ts_codes or None)
+    logger.info(f"同步结束：成功{stats['synced']}只，失败{stats['failed']}只，新增{stats['new_bars']}根K线")
+
+    if args.index_windows:
+        from stock.kline_embedding import kline_window_index
+        kline_window_index.index(args.ts_codes or None)
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+from loguru import logger
+from cache.redis_client import CustomJSONEncoder, AsyncRedisClient
+from stock.stock_selector import stock_selector
+from stock.kline_generator import kline_generator
+from utils.utils import analyze_kline_image
+
+# 批量分析默认数量（<=0 表示分析全部选股结果）
+BATCH_ANALYZE_SIZE = int(os.getenv("BATCH_ANALYZE_SIZE", 10))
+
+
+def resolve_batch(selected_stocks: list, batch_size: int = None) -> list:
+    """
+    按批量大小截取待分析股票（跳过无代码的股票）
+    :param selected_stocks: 选股结果
+    :param batch_size: 批量大小（None使用默认配置，<=0表示全部）
+    :return: 待分析股票列表
+    """
+    batch_size = BATCH_ANALYZE_SIZE if batch_size is None else batch_size
+    stocks = selected_stocks if batch_size <= 0 else selected_stocks[:batch_size]
+    return [s for s in stocks if s.get('ts_code')]
+
+
+async def analyze_one(stock: dict, df, kline_collection: any, redis_client: AsyncRedisClient) -> dict:
+    """
+    分析单只股票：渲染K线图（渲染线程）→ 特征提取（特征线程池）→ 大模型（并发上限）
+    :return: 单条分析结果（全字段可JSON序列化）
+    """
+    ts_code = stock['ts_code']
+    # 一次渲染同时得到展示图（web，写入缓存供图片地址读取）和发给大模型的压缩图（llm）
+    images = await kline_generator.generate_kline_images_async(ts_code, df)
+    analysis_result = await analyze_kline_image(images["llm"], ts_code, kline_collection, redis_client)
+
+    # 标准化分析结果（处理numpy/自定义类型）
+    analysis_result = json.loads(json.dumps(analysis_result, cls=CustomJSONEncoder))
+    # 构建单条结果：逐字段类型转换，确保可序列化
+    return {
+        "ts_code": str(ts_code),  # 确保是字符串
+        "stock_name": str(stock.get('name', '')),  # 兜底空字符串
+        "industry": str(stock.get('industry', '')),
+        # numpy数值转Python原生类型（如np.float64 → float）
+        "latest_price": float(stock.get('latest_price', 0.0)) if stock.get('latest_price') is not None else 0.0,
+        "macd": float(stock.get('macd', 0.0)) if stock.get('macd') is not None else 0.0,
+        "analysis_result": analysis_result,
+        # 只返回图片地址，图片由浏览器单独加载并缓存
+        "image_url": kline_generator.image_url(ts_code, df)
+    }
+
+
+async def iter_batch_analysis(stocks: list, kline_collection: any, redis_client: AsyncRedisClient):
+    """
+    并发分析多只股票，按完成顺序逐条产出结果
+    各阶段并发受各自资源限制（渲染线程/特征线程池/大模型信号量），单只失败不影响其他股票
+    :param stocks: 待分析股票列表
+    :return: 异步生成器，产出 (在stocks中的序号, 分析结果)
+    """
+    loop = asyncio.get_running_loop()
+    # 批量预取日线（Redis批量读取 + 多进程同步）放到线程中执行，不阻塞事件循环
+    daily_frames = await loop.run_in_executor(
+        None, stock_selector.get_daily_data_many, [s['ts_code'] for s in stocks]
+    )
+
+    async def run(index: int, stock: dict):
+        df = daily_frames.get(stock['ts_code'])
+        if df is None or df.empty:
+            return index, None
+        try:
+            return index, await analyze_one(stock, df, kline_collection, redis_client)
+        except Exception as e:
+            logger.error(f"批量分析{stock['ts_code']}失败: {str(e)}")
+            return index, None
+
+    tasks = [asyncio.create_task(run(i, stock)) for i, stock in enumerate(stocks)]
+    try:
+        for future in asyncio.as_completed(tasks):
+            index, result = await future
+            if result is not None:
+                yield index, result
+    finally:
+        # 调用方提前退出（如客户端断开）时取消未完成的任务
+        for task in tasks:
+            task.cancel()
+
+
+async def run_batch_analysis(stocks: list, kline_collection: any, redis_client: AsyncRedisClient) -> list:
+    """
+    并发分析多只股票，按输入顺序返回成功的结果
+    :param stocks: 待分析股票列表
+    :return: 分析结果列表
+    """
+    results = {}
+    async for index, result in iter_batch_analysis(stocks, kline_collection, redis_client):
+        results[index] = result
+    return [results[i] for i in sorted(results)]
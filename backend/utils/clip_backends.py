@@ -0,0 +1,136 @@
+import copy
+import os
+import re
+import numpy as np
+from loguru import logger
+
+# CLIP图像编码推理后端（与CLIP_MODEL_NAME配合使用）：
+#   eager        - PyTorch fp32 即时执行（默认，结果基准）
+#   int8         - Linear层动态int8量化（仅CPU）
+#   torchscript  - torch.jit.trace + freeze
+#   onnx         - 导出ONNX后由onnxruntime执行（需安装onnxruntime）
+CLIP_BACKENDS = ("eager", "int8", "torchscript", "onnx")
+# 导出的ONNX/TorchScript模型缓存目录
+CLIP_EXPORT_DIR = os.getenv("CLIP_EXPORT_DIR", "./clip_export")
+
+# CLIP视觉编码器的输入尺寸
+INPUT_SHAPE = (3, 224, 224)
+
+
+def _export_path(model_name: str, suffix: str) -> str:
+    """导出文件路径（模型名中的/等字符替换为_）"""
+    os.makedirs(CLIP_EXPORT_DIR, exist_ok=True)
+    return os.path.join(CLIP_EXPORT_DIR, f"{re.sub(r'[^0-9A-Za-z]+', '_', model_name)}{suffix}")
+
+
+def build_encoder(model: any, backend: str, device: str, model_name: str, num_threads: int = 0):
+    """
+    构建图像编码函数
+    :param model: clip.load 加载的fp32模型
+    :param backend: 推理后端（见CLIP_BACKENDS）
+    :param device: 模型所在设备
+    :param model_name: CLIP模型名（用于导出文件命名）
+    :param num_threads: onnxruntime intra-op线程数（0为默认值）
+    :return: encode(batch: torch.Tensor (N,3,224,224)) -> np.ndarray (N, D)，未归一化
+    """
+    import torch
+
+    if backend not in CLIP_BACKENDS:
+        raise RuntimeError(f"不支持的CLIP推理后端: {backend}，可选{','.join(CLIP_BACKENDS)}")
+    if backend != "eager" and device != "cpu":
+        logger.warning(f"CLIP推理后端{backend}仅用于CPU，当前设备{device}改用eager")
+        backend = "eager"
+
+    visual = model.visual.eval()
+    dtype = model.dtype
+
+    if backend == "eager":
+        def encode(batch):
+            with torch.no_grad():
+                return visual(batch.to(device).type(dtype)).float().cpu().numpy()
+        return encode
+
+    if backend == "int8":
+        # 只量化Linear层（Transformer中MLP与投影的主要计算量），激活按批动态量化
+        quantized = torch.ao.quantization.quantize_dynamic(copy.deepcopy(visual), {torch.nn.Linear}, dtype=torch.qint8)
+
+        def encode(batch):
+            with torch.no_grad():
+                return quantized(batch.float()).float().numpy()
+        return encode
+
+    example = torch.zeros((1,) + INPUT_SHAPE, dtype=torch.float32)
+    if backend == "torchscript":
+        path = _export_path(model_name, ".torchscript.pt")
+        if os.path.exists(path):
+            scripted = torch.jit.load(path)
+        else:
+            with torch.no_grad():
+                scripted = torch.jit.trace(visual, example)
+            scripted.save(path)
+            logger.info(f"CLIP视觉编码器已导出TorchScript：{path}")
+        scripted = torch.jit.freeze(scripted.eval())
+
+        def encode(batch):
+            with torch.no_grad():
+                return scripted(batch.float()).float().numpy()
+        return encode
+
+    # onnx
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise RuntimeError("CLIP推理后端onnx需要安装onnxruntime")
+    path = _export_path(model_name, ".onnx")
+    if not os.path.exists(path):
+        with torch.no_grad():
+            torch.onnx.export(
+                visual, example, path,
+                input_names=["pixel_values"], output_names=["image_embeds"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                opset_version=17
+            )
+        logger.info(f"CLIP视觉编码器已导出ONNX：{path}")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads > 0:
+        options.intra_op_num_threads = num_threads
+    session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def encode(batch):
+        return session.run(None, {"pixel_values": batch.float().numpy()})[0].astype(np.float32, copy=False)
+    return encode
+
+
+def cosine_drift(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """
+    对比两组特征向量的余弦相似度
+    :param reference: 基准特征（fp32 eager）
+    :param candidate: 待验证后端的特征
+    :return: {"min_cosine", "mean_cosine", "max_drift"}，max_drift = 1 - min_cosine
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+    return {
+        "min_cosine": round(float(cosine.min()), 6),
+        "mean_cosine": round(float(cosine.mean()), 6),
+        "max_drift": round(float(1 - cosine.min()), 6)
+    }
+
+
+def verify_encoder(model: any, encode, device: str, batch: any = None) -> dict:
+    """
+    验证推理后端相对fp32 eager的余弦偏差
+    :param model: fp32模型
+    :param encode: 待验证的编码函数
+    :param batch: 输入张量（默认8张固定随机种子的图片张量）
+    :return: 偏差统计（见cosine_drift）
+    """
+    import torch
+
+    if batch is None:
+        batch = torch.randn((8,) + INPUT_SHAPE, generator=torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        reference = model.visual(batch.to(device).type(model.dtype)).float().cpu().numpy()
+    return cosine_drift(reference, encode(batch))
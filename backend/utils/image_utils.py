@@ -1,27 +1,101 @@
+import asyncio
+import hashlib
 import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+import numpy as np
 from PIL import Image
-import torch
-import clip
 from dotenv import load_dotenv
 import os
+from cache.redis_client import redis_client
 
 # 加载环境变量
 load_dotenv()
 
-# 初始化CLIP模型（全局单例）
-device = "cuda" if torch.cuda.is_available() else "cpu"
+# CPU推理线程数（0表示使用torch默认值）
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", 0))
+
+# 单次CLIP前向推理的图片数
+CLIP_BATCH_SIZE = int(os.getenv("CLIP_BATCH_SIZE", 16))
+# 异步提取时等待凑批的最长时间（毫秒）
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+# 特征向量缓存过期时间（秒，<=0表示不缓存）
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", 7 * 86400))
 
 # 从.env读取官方模型名（如ViT-B/32）
 model_name = os.getenv("CLIP_MODEL_NAME", "ViT-B/32")
+# 图像编码推理后端：eager / int8 / torchscript / onnx（见utils/clip_backends.py）
+clip_backend = os.getenv("CLIP_BACKEND", "eager").lower()
+# 加载时是否校验推理后端相对fp32的余弦偏差（写入日志）
+CLIP_VERIFY = os.getenv("CLIP_VERIFY", "false").lower() == "true"
+
+# CLIP模型（全局单例，首次使用或预热时才导入torch并加载，避免拖慢进程启动）
+device = None
+clip_model = None
+clip_preprocess = None
+clip_encoder = None  # 按推理后端构建的编码函数
+clip_drift = None  # 推理后端相对fp32的余弦偏差（CLIP_VERIFY开启时）
+_clip_lock = threading.Lock()
+
+def load_clip() -> tuple:
+    """
+    加载CLIP模型（线程安全，只加载一次）
+    :return: (模型, 预处理函数)
+    """
+    global device, clip_model, clip_preprocess, clip_encoder, clip_drift
+    if clip_model is not None:
+        return clip_model, clip_preprocess
+    with _clip_lock:
+        if clip_model is not None:
+            return clip_model, clip_preprocess
+        start = time.perf_counter()
+        import torch
+        import clip
 
-clip_model, clip_preprocess = clip.load(
-    model_name,
-    device=device,
-    jit=False  # 禁用JIT编译，避免兼容性问题
+        # inter-op线程数须在任何并行计算前设置
+        if TORCH_NUM_THREADS > 0:
+            torch.set_num_threads(TORCH_NUM_THREADS)
+        if TORCH_INTEROP_THREADS > 0:
+            torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model, preprocess = clip.load(
+            model_name,
+            device=device,
+            jit=False  # 禁用JIT编译，避免兼容性问题
+        )
+        for param in model.parameters():
+            param.requires_grad = False
+
+        from utils.clip_backends import build_encoder, verify_encoder
+        clip_encoder = build_encoder(model, clip_backend, device, model_name, TORCH_NUM_THREADS)
+        if CLIP_VERIFY and clip_backend != "eager":
+            clip_drift = verify_encoder(model, clip_encoder, device)
+            logger.info(f"CLIP推理后端{clip_backend}相对fp32偏差：{clip_drift}")
+        clip_preprocess = preprocess
+        clip_model = model
+        logger.info(f"CLIP模型加载完成：{model_name}（{device}，{clip_backend}），耗时{time.perf_counter() - start:.2f}s")
+    return clip_model, clip_preprocess
+
+def clip_loaded() -> bool:
+    """CLIP模型是否已加载"""
+    return clip_model is not None
+
+# 特征提取线程池（torch推理期间释放GIL，避免阻塞事件循环）
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 1))
+embed_executor = ThreadPoolExecutor(
+    max_workers=EMBED_WORKERS,
+    thread_name_prefix="clip-embed"
 )
 
-for param in clip_model.parameters():
-    param.requires_grad = False
+# 图片预处理线程池（PIL解码/缩放期间释放GIL，可与推理并行）
+preprocess_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREPROCESS_WORKERS", os.cpu_count() or 1)),
+    thread_name_prefix="clip-preprocess"
+)
 
 def preprocess_image(image_bytes: bytes) -> Image.Image:
     """
@@ -36,19 +110,150 @@ def preprocess_image(image_bytes: bytes) -> Image.Image:
     except Exception as e:
         raise RuntimeError(f"图片预处理失败: {str(e)}")
 
+def _image_tensor(image_bytes: bytes):
+    """图片二进制 → CLIP输入张量（3×224×224）"""
+    return clip_preprocess(preprocess_image(image_bytes))
+
+def _encode_images(images: list, batch_size: int = None) -> np.ndarray:
+    """按批前向推理（不经过缓存），返回归一化特征矩阵"""
+    import torch
+    model, _ = load_clip()
+    if not images:
+        return np.empty((0, model.visual.output_dim), dtype=np.float32)
+    batch_size = batch_size or CLIP_BATCH_SIZE
+    try:
+        tensors = list(preprocess_executor.map(_image_tensor, images))
+        embeddings = [
+            clip_encoder(torch.stack(tensors[i:i + batch_size]))
+            for i in range(0, len(tensors), batch_size)
+        ]
+        embeddings = np.concatenate(embeddings).astype(np.float32, copy=False)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    except Exception as e:
+        logger.error(f"批量提取图片特征失败: {str(e)}")
+        raise RuntimeError(f"批量提取图片特征失败: {str(e)}")
+
+def embedding_cache_key(image_bytes: bytes) -> str:
+    """特征向量缓存键：模型名 + 推理后端 + 图片内容哈希（同一张图不论来源都命中同一键）"""
+    digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    return f"embedding:{model_name}:{clip_backend}:{digest}"
+
+def _get_cached_embeddings(keys: list) -> dict:
+    """
+    批量读取缓存的特征向量（L1 → Redis MGET）
+    :return: {缓存键: float32向量}，仅包含命中的键
+    """
+    found = {}
+    missing = []
+    for key in keys:
+        vector = redis_client.local.get(f"{key}#vector")
+        if vector is None:
+            missing.append(key)
+        else:
+            found[key] = vector
+    if missing:
+        for key, raw in redis_client.get_many(missing, "bytes").items():
+            vector = np.frombuffer(raw, dtype=np.float32).copy()
+            redis_client.local.set(f"{key}#vector", vector, EMBED_CACHE_TTL)
+            found[key] = vector
+    return found
+
+def _set_cached_embeddings(vectors: dict) -> None:
+    """批量写入特征向量缓存（Redis存float32原始字节，按TTL淘汰）"""
+    redis_client.set_many({key: vector.tobytes() for key, vector in vectors.items()}, EMBED_CACHE_TTL)
+    for key, vector in vectors.items():
+        redis_client.local.set(f"{key}#vector", vector, EMBED_CACHE_TTL)
+
+def extract_image_embeddings(images: list, batch_size: int = None) -> np.ndarray:
+    """
+    批量提取图片特征向量（按内容哈希缓存；未命中的图片并行预处理 + 按批前向推理）
+    :param images: 图片二进制数据列表
+    :param batch_size: 单次前向推理的图片数（默认CLIP_BATCH_SIZE）
+    :return: 归一化特征矩阵，形状为 (图片数, 特征维度)，float32
+    """
+    if not images or EMBED_CACHE_TTL <= 0:
+        return _encode_images(images, batch_size)
+
+    keys = [embedding_cache_key(image) for image in images]
+    vectors = _get_cached_embeddings(list(dict.fromkeys(keys)))
+    # 未命中的图片去重后推理（同一批内重复的图片只算一次）
+    pending = {key: image for key, image in zip(keys, images) if key not in vectors}
+    if pending:
+        encoded = _encode_images(list(pending.values()), batch_size)
+        computed = {key: vector.copy() for key, vector in zip(pending.keys(), encoded)}
+        _set_cached_embeddings(computed)
+        vectors.update(computed)
+    logger.info(f"特征向量缓存命中{len(images) - len(pending)}/{len(images)}张")
+    return np.stack([vectors[key] for key in keys])
+
 def extract_image_embedding(image_bytes: bytes) -> list:
     """
     提取图片特征向量
     :param image_bytes: 图片二进制数据
     :return: 特征向量列表
     """
-    try:
-        image = preprocess_image(image_bytes)
-        img_tensor = clip_preprocess(image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            embedding = clip_model.encode_image(img_tensor)
-        embedding = embedding / torch.norm(embedding, dim=1, keepdim=True)
-        return embedding.cpu().numpy().tolist()[0]
-    except Exception as e:
-        logger.error(f"提取图片特征失败: {str(e)}")
-        raise RuntimeError(f"提取图片特征失败: {str(e)}")
\ No newline at end of file
+    return extract_image_embeddings([image_bytes])[0].tolist()
+
+
+class EmbeddingBatcher:
+    """
+    异步特征提取的动态凑批：并发请求先进入队列，推理线程空闲时一次取出最多batch_size张图片
+    上一批推理期间到达的请求自动合并为下一批，批量分析时无需调用方显式组批
+    """
+    def __init__(self, batch_size: int = CLIP_BATCH_SIZE, max_wait_ms: float = EMBED_BATCH_WAIT_MS,
+                 workers: int = EMBED_WORKERS):
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._pending = []  # [(图片二进制, Future)]
+        self._running = 0  # 正在运行的推理批次数
+
+    async def embed(self, image_bytes: bytes) -> list:
+        """提取单张图片特征（与同时到达的其他请求合并推理）"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image_bytes, future))
+        if self._running < self.workers:
+            self._running += 1
+            asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self) -> None:
+        try:
+            if self.max_wait > 0 and len(self._pending) < self.batch_size:
+                await asyncio.sleep(self.max_wait)
+            loop = asyncio.get_running_loop()
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                images = [image for image, _ in batch]
+                try:
+                    embeddings = await loop.run_in_executor(embed_executor, extract_image_embeddings, images)
+                    results = [(embedding.tolist(), None) for embedding in embeddings]
+                except Exception:
+                    # 整批失败时逐张重试，只让有问题的图片报错
+                    results = []
+                    for image in images:
+                        try:
+                            results.append((await loop.run_in_executor(embed_executor, extract_image_embedding, image), None))
+                        except Exception as e:
+                            results.append((None, e))
+                for (_, future), (embedding, error) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(embedding)
+        finally:
+            self._running -= 1
+
+
+# 初始化异步特征提取凑批器单例
+embedding_batcher = EmbeddingBatcher()
+
+async def extract_image_embedding_async(image_bytes: bytes) -> list:
+    """
+    异步提取图片特征向量（不阻塞事件循环，并发请求自动合并为批量推理）
+    :param image_bytes: 图片二进制数据
+    :return: 特征向量列表
+    """
+    return await embedding_batcher.embed(image_bytes)
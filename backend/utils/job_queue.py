@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+import pandas as pd
+from loguru import logger
+from cache.redis_client import AsyncRedisClient
+from stock.stock_selector import stock_selector
+from utils.batch_pipeline import resolve_batch, iter_batch_analysis
+
+# 同时运行的批量分析任务数（单个任务内部仍按阶段并发）
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# 任务状态与结果的保存时间（秒）
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 86400))
+# 运行中任务超过该时间未更新进度视为已中断（如服务重启），允许重新提交
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 600))
+
+JOB_PREFIX = "job:batch_analyze:"
+
+
+class BatchJobQueue:
+    """
+    批量分析后台任务队列：提交即返回任务ID，进程内异步执行，状态与结果存Redis
+    相同参数在同一交易日内重复提交返回同一任务（已完成的任务直接返回结果）
+    """
+    def __init__(self, workers: int = JOB_WORKERS, ttl: int = JOB_RESULT_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self._semaphore = None  # 在事件循环内首次提交时创建
+        self._tasks = {}  # job_id -> asyncio.Task（持有引用，防止任务被回收）
+        self._submitting = {}  # job_id -> 进行中的提交（同进程并发提交同一任务时复用）
+
+    @staticmethod
+    def latest_trade_date() -> str:
+        """最近一个交易日（北京时间，YYYY-MM-DD；同步调用，会查询交易日历）"""
+        today = pd.Timestamp.now(tz="Asia/Shanghai")
+        trade_dates = stock_selector.get_trade_dates(
+            (today - pd.Timedelta(days=30)).strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
+        )
+        return trade_dates[-1] if trade_dates else today.strftime("%Y-%m-%d")
+
+    @staticmethod
+    def job_id(params: dict, trade_date: str) -> str:
+        """任务ID：参数 + 最近交易日的哈希（选股结果按交易日变化，周末/节假日提交与上一交易日为同一任务）"""
+        raw = json.dumps({**params, "date": trade_date}, sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"{JOB_PREFIX}{job_id}"
+
+    @staticmethod
+    def _item_key(job_id: str, index: int) -> str:
+        return f"{JOB_PREFIX}{job_id}:item:{index}"
+
+    async def _save(self, redis_client: AsyncRedisClient, job: dict) -> None:
+        job["updated_at"] = time.time()
+        await redis_client.set_cache(self._job_key(job["job_id"]), job, self.ttl)
+
+    async def get(self, job_id: str, redis_client: AsyncRedisClient) -> dict:
+        """获取任务状态，不存在返回None"""
+        return await redis_client.get_cache(self._job_key(job_id), "dict")
+
+    async def submit(self, params: dict, kline_collection: any, redis_client: AsyncRedisClient) -> dict:
+        """
+        提交批量分析任务
+        :param params: 任务参数（fast/slow/signal/batch_size）
+        :return: 任务状态（已存在的有效任务直接返回）
+        """
+        trade_date = await asyncio.get_running_loop().run_in_executor(None, self.latest_trade_date)
+        job_id = self.job_id(params, trade_date)
+        # 取得任务ID后、下一个await之前同步占位，并发提交同一任务时只有一个会创建执行任务
+        submitting = self._submitting.get(job_id)
+        if submitting is None:
+            submitting = asyncio.ensure_future(self._submit(job_id, params, kline_collection, redis_client))
+            self._submitting[job_id] = submitting
+            submitting.add_done_callback(lambda _: self._submitting.pop(job_id, None))
+        return await asyncio.shield(submitting)
+
+    async def _submit(self, job_id: str, params: dict, kline_collection: any, redis_client: AsyncRedisClient) -> dict:
+        """提交任务的实际逻辑（同一job_id同时只有一个在执行）"""
+        job = await self.get(job_id, redis_client)
+        if job and job["status"] == "done":
+            return job
+        if job and job["status"] in ("queued", "running"):
+            # 本进程正在执行，或其他进程近期仍在更新进度
+            if job_id in self._tasks or time.time() - job.get("updated_at", 0) < JOB_STALE_SECONDS:
+                return job
+            logger.warning(f"批量分析任务{job_id}已中断，重新执行")
+
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "params": params,
+            "total_selected": 0,
+            "total": 0,
+            "completed": 0,
+            "indices": [],  # 已完成结果在待分析列表中的序号（按完成顺序）
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None
+        }
+        await self._save(redis_client, job)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        task = asyncio.create_task(self._run(job, kline_collection, redis_client))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        logger.info(f"批量分析任务{job_id}已提交：{params}")
+        return job
+
+    @asynccontextmanager
+    async def _slot(self, job: dict, redis_client: AsyncRedisClient):
+        """占用一个执行名额（排队期间定期刷新updated_at，避免排队中的任务被误判为已中断而重复执行）"""
+        interval = max(1, JOB_STALE_SECONDS // 3)
+        while True:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=interval)
+                break
+            except asyncio.TimeoutError:
+                await self._save(redis_client, job)
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _run(self, job: dict, kline_collection: any, redis_client: AsyncRedisClient) -> None:
+        """执行任务：选股 → 并发分析，每完成一只即保存结果并更新进度"""
+        job_id = job["job_id"]
+        params = job["params"]
+        async with self._slot(job, redis_client):
+            try:
+                job["status"] = "running"
+                await self._save(redis_client, job)
+
+                selected_stocks = await asyncio.get_running_loop().run_in_executor(
+                    None, stock_selector.select_stocks, params.get("fast"), params.get("slow"), params.get("signal")
+                )
+                stocks = resolve_batch(selected_stocks, params.get("batch_size"))
+                job["total_selected"] = len(selected_stocks)
+                job["total"] = len(stocks)
+                await self._save(redis_client, job)
+
+                async for index, result in iter_batch_analysis(stocks, kline_collection, redis_client):
+                    await redis_client.set_cache(self._item_key(job_id, index), result, self.ttl)
+                    job["indices"].append(index)
+                    job["completed"] = len(job["indices"])
+                    await self._save(redis_client, job)
+
+                job["status"] = "done"
+                logger.info(f"批量分析任务{job_id}完成，共分析{job['completed']}只股票")
+            except asyncio.CancelledError:
+                job["status"] = "failed"
+                job["error"] = "任务已取消"
+                raise
+            except Exception as e:
+                logger.error(f"批量分析任务{job_id}失败: {str(e)}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished_at"] = datetime.now().isoformat()
+                await self._save(redis_client, job)
+
+    async def results(self, job: dict, redis_client: AsyncRedisClient, offset: int = 0) -> list:
+        """
+        获取任务已完成的结果（可在任务运行中调用，获取部分结果）
+        :param job: 任务状态
+        :param offset: 跳过按完成顺序的前offset条（用于增量轮询）
+        :return: [{"index": 序号, "data": 分析结果}]，按完成顺序
+        """
+        indices = job["indices"][offset:]
+        keys = [self._item_key(job["job_id"], index) for index in indices]
+        items = await redis_client.get_many(keys, "dict")
+        return [
+            {"index": index, "data": items[key]}
+            for index, key in zip(indices, keys) if key in items
+        ]
+
+    async def shutdown(self) -> None:
+        """取消本进程内未完成的任务（服务停止时调用）"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+# 初始化批量分析任务队列单例
+batch_job_queue = BatchJobQueue()
@@ -1,231 +1,289 @@
+import asyncio
 import base64
-import http
-import json
-import os
-import uuid
+import hashlib
+import random
+import time
+from typing import Union
+import httpx
 from loguru import logger
-import google.generativeai as genai
-from openai import OpenAI
 import pandas as pd
-from cache.redis_client import RedisClient
-from utils.image_utils import extract_image_embedding
+from cache.redis_client import AsyncRedisClient
+from utils.image_utils import extract_image_embedding_async
+from stock.kline_embedding import kline_window_index
+from stock.stock_selector import stock_selector
 from config import (
-    OPENAI_API_KEY, OPENAI_MODEL,
-    GEMINI_API_KEY, GEMINI_MODEL,
-    USE_MODEL, TEMP_DIR,USE_PROXY,
-    ANALYSIS_PROMPT, LLM_TYPE, API_KEY
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_BASE_URL,
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_BASE_URL,
+    USE_MODEL, USE_PROXY, PROXY_BASE_URL,
+    ANALYSIS_PROMPT, LLM_TYPE, API_KEY,
+    LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF,
+    KLINE_SIMILARITY_MODE, ANALYSIS_REFRESH_TIME, ANALYSIS_LOCK_TIMEOUT
 )
 
-# 初始化AI客户端
-clients = {}
-if USE_MODEL == "chatgpt" and USE_PROXY == "false" and OPENAI_API_KEY:
-    clients["openai"] = OpenAI(api_key=OPENAI_API_KEY)
-    clients["proxy"] = False
-elif USE_MODEL == "gemini" and USE_PROXY == "false" and GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    clients["gemini"] = genai.GenerativeModel(GEMINI_MODEL)
-    clients["proxy"] = False
-elif USE_PROXY == "true":
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-        'Accept': 'application/json',
-    }
-    clients["baseUrl"] = "https://poloai.top/v1/"
-    clients["headers"] = headers
-    clients["modelType"] = LLM_TYPE
-    clients["proxy"] = True
-
-def generate_unique_filename(extension: str) -> str:
-    """
-    生成唯一的文件名
-    :param extension: 文件扩展名
-    :return: 唯一文件名
-    """
-    return f"{uuid.uuid4()}.{extension.lstrip('.')}"
+# 图片二进制数据：bytes，或指向内存的 memoryview（无需先写入临时文件）
+ImageData = Union[bytes, bytearray, memoryview]
 
-def save_uploaded_file(file_content: bytes, extension: str) -> str:
-    """
-    保存上传的文件到临时目录
-    :param file_content: 文件二进制内容
-    :param extension: 文件扩展名
-    :return: 文件保存路径
-    """
-    filename = generate_unique_filename(extension)
-    file_path = os.path.join(TEMP_DIR, filename)
-    
-    try:
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        logger.info(f"文件保存成功：{file_path}")
-        return file_path
-    except Exception as e:
-        logger.error(f"保存文件失败：{str(e)}")
-        raise
+# ====================== 异步大模型客户端 ======================
+# 需要重试的HTTP状态码（限流/服务端临时错误）
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
 
-def image_to_base64(image_path: str) -> str:
+def guess_image_mime(image: ImageData) -> str:
     """
-    将图片转换为Base64编码
-    :param image_path: 图片路径
-    :return: Base64编码字符串
+    根据文件头判断图片MIME类型
+    :param image: 图片二进制数据
+    :return: MIME类型（无法识别时按PNG处理）
     """
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-    except Exception as e:
-        logger.error(f"图片转Base64失败：{str(e)}")
-        raise
+    image = bytes(image[:12])
+    if image[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
 
-def analyze_with_chatgpt(image_path: str) -> str:
-    """
-    使用ChatGPT-4V分析K线图片
-    :param image_path: 图片路径
-    :return: 分析结果
-    """
-    if "openai" not in clients:
-        raise ValueError("ChatGPT客户端未初始化，请检查API密钥")
-    
-    try:
-        # 图片转Base64
-        base64_image = image_to_base64(image_path)
-        
-        # 调用OpenAI API
-        response = clients["openai"].chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
+class LLMClient:
+    """异步大模型客户端基类：连接池复用（keep-alive）+ 并发上限 + 超时 + 指数退避重试"""
+    name = "llm"
+
+    def __init__(self, base_url: str, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff: float = LLM_RETRY_BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """首次使用时创建共享的HTTP连接池"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+        return self._http
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def build_request(self, image: bytes, prompt: str) -> tuple:
+        """构造请求，返回 (路径, 请求头, 请求体, 查询参数)"""
+        raise NotImplementedError
+
+    def parse_response(self, data: dict) -> str:
+        """从响应JSON中提取分析文本"""
+        raise NotImplementedError
+
+    async def analyze(self, image: bytes, prompt: str = ANALYSIS_PROMPT) -> str:
+        """
+        分析K线图片
+        :param image: 图片二进制数据
+        :param prompt: 提示词
+        :return: 分析结果
+        """
+        path, headers, payload, params = self.build_request(image, prompt)
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.http.post(path, headers=headers, json=payload, params=params)
+                    if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                        raise httpx.HTTPStatusError(
+                            f"HTTP {response.status_code}", request=response.request, response=response
+                        )
+                    response.raise_for_status()
+                    result = self.parse_response(response.json())
+                    logger.info(f"{self.name}分析完成")
+                    return result
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                    if attempt >= self.max_retries or (status is not None and status not in RETRYABLE_STATUS):
+                        logger.error(f"{self.name}分析失败：{str(e)}")
+                        raise RuntimeError(f"{self.name}分析失败：{str(e)}")
+                    # 指数退避 + 随机抖动，避免并发请求同时重试
+                    delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                    logger.warning(f"{self.name}请求失败（{str(e)}），{delay:.1f}秒后第{attempt + 1}次重试")
+                    await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        """关闭HTTP连接池"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+class OpenAIClient(LLMClient):
+    """OpenAI兼容接口（ChatGPT官方接口 / 代理接口）"""
+    def __init__(self, base_url: str, api_key: str, model: str, max_tokens: int = 1500,
+                 temperature: float = 0.3, name: str = "ChatGPT", **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.api_key = api_key
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.name = name
+
+    def build_request(self, image: bytes, prompt: str) -> tuple:
+        base64_image = base64.b64encode(image).decode("utf-8")
+        payload = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "messages": [
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": ANALYSIS_PROMPT},
+                        {"type": "text", "text": prompt},
                         {
                             "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
+                            "image_url": {"url": f"data:{guess_image_mime(image)};base64,{base64_image}"}
                         }
                     ]
                 }
-            ],
-            max_tokens=1500,
-            temperature=0.3,  # 低随机性，保证分析结果稳定
-        )
-        
-        result = response.choices[0].message.content.strip()
-        logger.info("ChatGPT分析完成")
-        return result
-    except Exception as e:
-        logger.error(f"ChatGPT分析失败：{str(e)}")
-        raise
+            ]
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}", "Accept": "application/json"}
+        return "/chat/completions", headers, payload, None
 
-def analyze_with_gemini(image_path: str) -> str:
+    def parse_response(self, data: dict) -> str:
+        if data.get("error"):
+            raise RuntimeError(f"{self.name}返回错误：{data['error']}")
+        return data["choices"][0]["message"]["content"].strip()
+
+class GeminiClient(LLMClient):
+    """Gemini REST接口（generateContent）"""
+    name = "Gemini"
+
+    def __init__(self, base_url: str, api_key: str, model: str, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.api_key = api_key
+        self.model = model
+
+    def build_request(self, image: bytes, prompt: str) -> tuple:
+        payload = {
+            "contents": [{
+                "parts": [
+                    {"text": prompt},
+                    {"inline_data": {"mime_type": guess_image_mime(image), "data": base64.b64encode(image).decode("utf-8")}}
+                ]
+            }]
+        }
+        return f"/models/{self.model}:generateContent", None, payload, {"key": self.api_key}
+
+    def parse_response(self, data: dict) -> str:
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts).strip()
+
+_llm_client = None
+
+def get_llm_client() -> LLMClient:
+    """按配置（USE_PROXY/USE_MODEL）返回大模型客户端单例"""
+    global _llm_client
+    if _llm_client is None:
+        if USE_PROXY == "true":
+            _llm_client = OpenAIClient(PROXY_BASE_URL, API_KEY, LLM_TYPE, max_tokens=4000, temperature=1, name=LLM_TYPE)
+        elif USE_MODEL == "chatgpt":
+            if not OPENAI_API_KEY:
+                raise ValueError("ChatGPT客户端未初始化，请检查API密钥")
+            _llm_client = OpenAIClient(OPENAI_BASE_URL, OPENAI_API_KEY, OPENAI_MODEL)
+        elif USE_MODEL == "gemini":
+            if not GEMINI_API_KEY:
+                raise ValueError("Gemini客户端未初始化，请检查API密钥")
+            _llm_client = GeminiClient(GEMINI_BASE_URL, GEMINI_API_KEY, GEMINI_MODEL)
+        else:
+            raise ValueError(f"不支持的模型类型：{USE_MODEL}")
+    return _llm_client
+
+async def close_llm_client() -> None:
+    """关闭大模型客户端的HTTP连接池（服务停止时调用）"""
+    if _llm_client is not None:
+        await _llm_client.close()
+
+async def analyze(image: bytes, prompt: str = ANALYSIS_PROMPT) -> str:
     """
-    使用Gemini Pro Vision分析K线图片
-    :param image_path: 图片路径
+    统一的大模型分析接口（OpenAI/Gemini/代理）
+    :param image: 图片二进制数据
+    :param prompt: 提示词
     :return: 分析结果
     """
-    if "gemini" not in clients:
-        raise ValueError("Gemini客户端未初始化，请检查API密钥")
-    
-    try:
-        # 读取图片
-        with open(image_path, "rb") as image_file:
-            image_data = image_file.read()
-        
-        # 调用Gemini API
-        response = clients["gemini"].generate_content([
-            ANALYSIS_PROMPT,
-            {"mime_type": "image/jpeg", "data": image_data}
-        ])
-        response.resolve()
-        
-        result = response.text.strip()
-        logger.info("Gemini分析完成")
-        return result
-    except Exception as e:
-        logger.error(f"Gemini分析失败：{str(e)}")
-        raise
+    return await get_llm_client().analyze(image, prompt)
 
-async def analyze_with_Proxy(image_path: str) -> str:
+async def analyze_uploaded_kline_image(image: ImageData) -> str:
     """
-    使用Gemini Pro Vision分析K线图片
-    :param image_path: 图片路径
+    统一的K线图片分析入口
+    :param image: 图片二进制数据（bytes / memoryview）
     :return: 分析结果
-    """      
-    
-    if "gpt" in clients["modelType"]:
-        base64_image = image_to_base64(image_path)
-        content = [
-                        {"type": "text", "text": ANALYSIS_PROMPT},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-    elif "gemini" in clients["modelType"]:
-        with open(image_path, "rb") as image_file:
-                image_data = image_file.read()
-        content = [ANALYSIS_PROMPT,
-                        {"mime_type": "image/jpeg", "data": image_data}
-                    ]
-    
-    
-    try:
-        conn = http.client.HTTPSConnection("poloai.top")
-        payload = json.dumps({
-            "model": "gpt-4o",
-            "max_tokens": 4000,
-            "temperature": 1,
-            # "frequency_penalty": 0.05,
-            # "presence_penalty": 0.0,
-            # "top_p": 1,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
-        })
-        
-        conn.request("POST", "/v1/chat/completions", payload, headers)
-        res = conn.getresponse()
-        data = res.read()
-        result = data.decode("utf-8")
-        resultjson = json.loads(result)
+    """
+    return await analyze(image, ANALYSIS_PROMPT)
+
+async def similar_klines_by_image(image: ImageData, ts_code: str, kline_collection: any) -> tuple:
+    """
+    用K线图CLIP特征检索相似K线
+    :return: ([{"股票代码", "相似度", "分析"}], 图片特征向量)
+    """
+    # 提取图片特征
+    embedding = await extract_image_embedding_async(bytes(image))
+    logger.info(f"提取图片特征完成：{ts_code}")
+    logger.info(f"图片特征向量（前10维）：{embedding[:10]}")
     
-        if hasattr(data, "error"):
-            
-            print(f"请求失败，状态码: {resultjson.error}")
-            return resultjson.error.message
-        else:
-            resultjson = json.loads(result)
-            return resultjson["choices"][0]["message"]["content"].strip()
-            
-    except Exception as e:
-        logger.error(f"${clients["modelType"]}分析失败：{str(e)}")
-        raise
+    # 检索相似K线
+    similar_klines = []
+    if kline_collection.count() > 0:
+        results = kline_collection.query(
+            query_embeddings=[embedding],
+            n_results=3,
+            include=["metadatas", "documents", "distances"]
+        )
+        for idx, distance in enumerate(results["distances"][0]):
+            if distance < 1.0:
+                similar_klines.append({
+                    "股票代码": results["metadatas"][0][idx].get("ts_code"),
+                    "相似度": round(float(distance), 4),
+                    "分析": results["documents"][0][idx]
+                })
+    return similar_klines, embedding
+
+# ====================== 分析结果缓存 ======================
+# 进程内正在进行的分析（缓存键 -> asyncio.Future），同一键的并发请求共享一次大模型调用
+_analysis_flights = {}
+# 等待其他进程完成同一分析时的轮询间隔（秒）
+ANALYSIS_POLL_INTERVAL = 0.5
 
-async def analyze_uploaded_kline_image(image_path: str) -> str:
+def analysis_cache_key(image: ImageData, ts_code: str, user_question: str) -> str:
     """
-    统一的K线图片分析入口
-    :param image_path: 图片路径
-    :return: 分析结果
+    分析结果缓存键：模型 + K线图内容哈希 + 分析问题哈希
+    K线图内容随最新交易日变化，日线更新后自然换键，不会返回过期的分析
     """
-    if USE_MODEL == "chatgpt" and USE_PROXY == "false":
-        return analyze_with_chatgpt(image_path)
-    elif USE_MODEL == "gemini" and USE_PROXY == "false":
-        return analyze_with_gemini(image_path)
-    elif USE_PROXY == "true":
-        return await analyze_with_Proxy(image_path)
-    else:
-        raise ValueError(f"不支持的模型类型：{USE_MODEL}")
+    client = get_llm_client()
+    model = f"{client.name}:{getattr(client, 'model', USE_MODEL)}"
+    chart_hash = hashlib.blake2b(image, digest_size=16).hexdigest()
+    question_hash = hashlib.blake2b(user_question.encode("utf-8"), digest_size=8).hexdigest()
+    return f"analysis:{ts_code}:{model}:{chart_hash}:{question_hash}"
 
-# ====================== 核心分析函数 ======================
-async def analyze_kline_image(image_path: str, ts_code: str, kline_collection:any, redis_client: RedisClient, user_question: str = None) -> str:
+def analysis_cache_ttl(now: pd.Timestamp = None) -> int:
+    """
+    分析结果有效期（秒）：到下一个交易日的日线更新时间（ANALYSIS_REFRESH_TIME）为止，周末和节假日不提前过期
+    :param now: 当前时间（默认北京时间当前时刻）
     """
-    分析K线图
-    :param image_bytes: K线图二进制数据
+    now = now if now is not None else pd.Timestamp.now(tz="Asia/Shanghai")
+    start = now.strftime("%Y-%m-%d")
+    end = (now + pd.Timedelta(days=30)).strftime("%Y-%m-%d")
+    for trade_date in stock_selector.get_trade_dates(start, end):
+        refresh = pd.Timestamp(f"{trade_date} {ANALYSIS_REFRESH_TIME}", tz="Asia/Shanghai")
+        if refresh > now:
+            return max(60, int((refresh - now).total_seconds()))
+    return 86400
+
+async def analyze_kline_image(image: ImageData, ts_code: str, kline_collection:any, redis_client: AsyncRedisClient, user_question: str = None) -> str:
+    """
+    分析K线图（结果按 模型/K线图内容/分析问题 缓存；同一缓存键同时只有一次大模型调用）
+    :param image: K线图二进制数据（bytes / memoryview）
     :param ts_code: 股票代码
     :param user_question: 分析问题（默认使用通用问题）
     :return: 分析结论
@@ -242,38 +300,79 @@ async def analyze_kline_image(image_path: str, ts_code: str, kline_collection:an
     logger.debug(f"分析问题：{user_question}")
 
     # 缓存分析结果
-    cache_key = f"analysis:{USE_MODEL}:{ts_code}"
-    cached_analysis = redis_client.get_cache(cache_key, "str")
+    cache_key = analysis_cache_key(image, ts_code, user_question)
+    cached_analysis = await redis_client.get_cache(cache_key, "str")
     logger.info(f"检查缓存：{cache_key}，存在：{bool(cached_analysis)}")
     if cached_analysis:
         return cached_analysis
-    
+
+    # 本进程已有相同分析在进行，等待其结果
+    flight = _analysis_flights.get(cache_key)
+    if flight is not None:
+        logger.info(f"等待进行中的分析：{cache_key}")
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            if not flight.cancelled():
+                raise
+            # 发起分析的请求被取消，由当前请求重新发起
+            return await analyze_kline_image(image, ts_code, kline_collection, redis_client, user_question)
+
+    flight = _analysis_flights[cache_key] = asyncio.get_running_loop().create_future()
     try:
-        logger.info(f"读取图片文件路径: {image_path}")
-        with open(image_path, "rb") as image_file:
-            image_bytes = image_file.read()
-        logger.info(f"K线图读取完成：{ts_code}")
-
-        # 提取图片特征
-        embedding = extract_image_embedding(image_bytes)
-        logger.info(f"提取图片特征完成：{ts_code}")
-        logger.info(f"图片特征向量（前10维）：{embedding[:10]}")
-        
-        # 检索相似K线
-        similar_klines = []
-        if kline_collection.count() > 0:
-            results = kline_collection.query(
-                query_embeddings=[embedding],
-                n_results=3,
-                include=["metadatas", "documents", "distances"]
+        analysis_result = await _analyze_with_lock(image, ts_code, kline_collection, redis_client, user_question, cache_key)
+        flight.set_result(analysis_result)
+        return analysis_result
+    except Exception as e:
+        flight.set_exception(e)
+        flight.exception()  # 标记异常已读取（无等待方时不输出警告）
+        raise
+    finally:
+        if not flight.done():
+            flight.cancel()
+        _analysis_flights.pop(cache_key, None)
+
+async def _analyze_with_lock(image: ImageData, ts_code: str, kline_collection: any, redis_client: AsyncRedisClient,
+                             user_question: str, cache_key: str) -> str:
+    """持有分布式锁执行分析并写入缓存；锁被其他进程持有时等待其结果，锁释放仍无结果则自行分析"""
+    lock_key = f"lock:{cache_key}"
+    token = await redis_client.acquire_lock(lock_key, ANALYSIS_LOCK_TIMEOUT)
+    if token is None:
+        logger.info(f"其他进程正在分析，等待结果：{cache_key}")
+        deadline = time.monotonic() + ANALYSIS_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(ANALYSIS_POLL_INTERVAL)
+            if not await redis_client.is_locked(lock_key):
+                break
+        cached_analysis = await redis_client.get_cache(cache_key, "str")
+        if cached_analysis:
+            return cached_analysis
+        token = await redis_client.acquire_lock(lock_key, ANALYSIS_LOCK_TIMEOUT)
+
+    try:
+        analysis_result = await _analyze_kline_image(image, ts_code, kline_collection, user_question)
+        ttl = await asyncio.get_running_loop().run_in_executor(None, analysis_cache_ttl)
+        await redis_client.set_cache(cache_key, analysis_result, ttl)
+        return analysis_result
+    finally:
+        if token:
+            await redis_client.release_lock(lock_key, token)
+
+# ====================== 核心分析函数 ======================
+async def _analyze_kline_image(image: ImageData, ts_code: str, kline_collection: any, user_question: str) -> str:
+    """
+    检索相似K线并调用大模型分析（不读写分析缓存）
+    :return: 分析结论
+    """
+    try:
+        embedding = None
+        if KLINE_SIMILARITY_MODE == "numeric":
+            # 数值K线窗口向量检索相似走势（只读日线，无需渲染和CLIP）
+            similar_klines = await asyncio.get_running_loop().run_in_executor(
+                None, kline_window_index.similar, ts_code
             )
-            for idx, distance in enumerate(results["distances"][0]):
-                if distance < 1.0:
-                    similar_klines.append({
-                        "股票代码": results["metadatas"][0][idx].get("ts_code"),
-                        "相似度": round(float(distance), 4),
-                        "分析": results["documents"][0][idx]
-                    })
+        else:
+            similar_klines, embedding = await similar_klines_by_image(image, ts_code, kline_collection)
         
         # 构建提示词
         prompt = f"""
@@ -294,42 +393,22 @@ async def analyze_kline_image(image_path: str, ts_code: str, kline_collection:an
 4. 语言简洁，逻辑清晰，使用中文作答。
         """
         
-        # 调用大模型
-        if USE_MODEL == "chatgpt" and USE_PROXY == "false":
-            analysis_result = analyze_with_chatgpt(image_path)
-        elif USE_MODEL == "gemini" and USE_PROXY == "false":
-            analysis_result = analyze_with_gemini(image_path)
-        elif USE_PROXY == "true":
-            analysis_result = await analyze_with_Proxy(image_path)
-        else:
-            raise ValueError(f"不支持的模型类型：{USE_MODEL}")
+        # 调用大模型：发送上面构建的提示词（含分析问题和相似K线参考），而不是通用的ANALYSIS_PROMPT；
+        # 上传图片分析（analyze_uploaded_kline_image）没有股票上下文，仍使用ANALYSIS_PROMPT
+        analysis_result = await analyze(image, prompt)
         
         logger.info(f"K线图分析完成：{ts_code}")
         logger.debug(f"分析结果：{analysis_result}")
-
-        # 缓存分析结果
-        redis_client.set_cache(cache_key, analysis_result)
         
-        # 存入向量库
-        kline_collection.add(
-            embeddings=[embedding],
-            metadatas=[{"ts_code": ts_code, "analysis_time": str(pd.Timestamp.now())}],
-            documents=[analysis_result],
-            ids=[f"{ts_code}_{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}"]
-        )
+        # 存入向量库（CLIP模式下才有图片特征）
+        if embedding is not None:
+            kline_collection.add(
+                embeddings=[embedding],
+                metadatas=[{"ts_code": ts_code, "analysis_time": str(pd.Timestamp.now())}],
+                documents=[analysis_result],
+                ids=[f"{ts_code}_{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}"]
+            )
         
         return analysis_result
     except Exception as e:
         raise RuntimeError(f"分析K线图失败: {str(e)}")
-    
-def clean_temp_file(file_path: str):
-    """
-    清理临时文件
-    :param file_path: 文件路径
-    """
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"临时文件已删除：{file_path}")
-    except Exception as e:
-        logger.error(f"删除临时文件失败：{str(e)}")
\ No newline at end of file
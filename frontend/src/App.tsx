@@ -84,12 +84,15 @@ const App: React.FC = () => {
             type={healthStatus.status === 'healthy' ? 'success' : 'danger'}
             style={{ marginBottom: 20, display: 'block' }}
           >
-            服务状态: {healthStatus.status} | 向量库数据量: {healthStatus.chroma_count} | 更新时间: {healthStatus.timestamp}
+            服务状态: {healthStatus.status} | 向量库数据量: {healthStatus.chroma_loaded ? healthStatus.chroma_count : '未加载'} | 更新时间: {healthStatus.timestamp}
           </Text>
         )}
 
         {/* 选股组件 */}
-        <StockSelector onSelectComplete={handleSelectComplete} />
+        <StockSelector
+          onSelectComplete={handleSelectComplete}
+          onSelectProgress={setSelectedStocks}
+        />
 
         {/* 选股结果 */}
         {selectedStocks && (
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Card, Collapse, Image, Typography, Button, Space, message, Tag } from 'antd';
 import { BatchAnalysisItem, AnalyzeStockResponse } from '../types/APITypes';
-import { batchAnalyze, clearCache } from '../services/api';
+import { batchAnalyzeStream, clearCache, klineImageSrc } from '../services/api';
 
 const { Panel } = Collapse;
 const { Title, Text } = Typography;
@@ -31,15 +31,22 @@ const KlineAnalysis: React.FC<KlineAnalysisProps> = ({ fast, slow, signal }) =>
     };
   }, []);
 
-  // 批量分析
+  // 批量分析（流式：每只股票分析完成即追加展示）
   const handleBatchAnalyze = async () => {
     try {
       setLoading(true);
-      const result = await batchAnalyze(fast, slow, signal);
-      setBatchResult(result.data);
-      setBatchCount(result.count);
+      setBatchResult([]);
+      setBatchCount(0);
       setSingleResult(null); // 清空单股票结果
-      message.success(`批量分析完成，共分析${result.count}只股票`);
+      await batchAnalyzeStream((event) => {
+        if (event.type === 'meta') {
+          setBatchCount(event.count);
+        } else if (event.type === 'item') {
+          setBatchResult((prev) => [...prev, event.data]);
+        } else if (event.type === 'done') {
+          message.success(`批量分析完成，共分析${event.count}只股票`);
+        }
+      }, fast, slow, signal);
     } catch (error) {
       console.error('批量分析失败:', error);
     } finally {
@@ -75,7 +82,7 @@ const KlineAnalysis: React.FC<KlineAnalysisProps> = ({ fast, slow, signal }) =>
         <Collapse defaultActiveKey={['1', '2']}>
           <Panel header="K线图" key="1">
             <Image
-              src={`data:image/png;base64,${singleResult.image_base64}`}
+              src={klineImageSrc(singleResult.image_url)}
               alt={`${singleResult.ts_code} K线图`}
               style={{ maxWidth: '100%' }}
             />
@@ -99,12 +106,12 @@ const KlineAnalysis: React.FC<KlineAnalysisProps> = ({ fast, slow, signal }) =>
 
   // 渲染批量分析结果
   const renderBatchResult = () => {
-    if (batchResult.length === 0) return null;
+    if (batchResult.length === 0 && !loading) return null;
 
     return (
       <div style={{ marginBottom: 20 }}>
         <Title level={5} style={{ marginBottom: 10 }}>
-          批量分析结果（共{batchCount}只）
+          批量分析结果（{loading ? `已完成${batchResult.length}/${batchCount}只` : `共${batchResult.length}只`}）
         </Title>
         {batchResult.map((item) => (
           <Card
@@ -115,7 +122,7 @@ const KlineAnalysis: React.FC<KlineAnalysisProps> = ({ fast, slow, signal }) =>
             <Collapse defaultActiveKey={['2']}>
               <Panel header="K线图" key="1">
                 <Image
-                  src={`data:image/png;base64,${item.image_base64}`}
+                  src={klineImageSrc(item.image_url)}
                   alt={`${item.ts_code} K线图`}
                   style={{ maxWidth: '100%' }}
                 />
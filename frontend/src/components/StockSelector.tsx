@@ -1,16 +1,18 @@
 import React, { useState } from 'react';
 import { Form, InputNumber, Button, Card, Typography, Space, message } from 'antd';
 import { SearchOutlined } from '@ant-design/icons';
-import { selectStocks } from '../services/api';
-import { SelectStocksResponse } from '../types/APITypes';
+import { selectStocksStream } from '../services/api';
+import { SelectStocksResponse, StockBasic } from '../types/APITypes';
 
 const { Title, Text } = Typography;
 
 interface StockSelectorProps {
   onSelectComplete: (data: SelectStocksResponse) => void;
+  // 流式选股过程中每到达一只股票回调一次（data为目前已到达的股票）
+  onSelectProgress?: (data: SelectStocksResponse) => void;
 }
 
-const StockSelector: React.FC<StockSelectorProps> = ({ onSelectComplete }) => {
+const StockSelector: React.FC<StockSelectorProps> = ({ onSelectComplete, onSelectProgress }) => {
   const [loading, setLoading] = useState<boolean>(false);
   const [form] = Form.useForm();
 
@@ -21,14 +23,32 @@ const StockSelector: React.FC<StockSelectorProps> = ({ onSelectComplete }) => {
     signal: 9
   };
 
-  // 执行选股
+  // 执行选股（流式返回，股票逐条渲染）
   const handleSelect = async () => {
     try {
       setLoading(true);
       const values = form.getFieldsValue();
-      const result = await selectStocks(values.fast, values.slow, values.signal);
-      message.success(`选股完成，共筛选出${result.count}只符合MACD金叉条件的股票`);
-      onSelectComplete(result);
+      const stocks: StockBasic[] = [];
+      await selectStocksStream((event) => {
+        if (event.type === 'item') {
+          stocks.push(event.data);
+          onSelectProgress?.({
+            status: 'running',
+            count: stocks.length,
+            data: [...stocks],
+            timestamp: new Date().toISOString()
+          });
+        } else if (event.type === 'done') {
+          message.success(`选股完成，共筛选出${event.count}只符合MACD金叉条件的股票`);
+          onSelectComplete({
+            status: 'success',
+            count: event.count,
+            data: stocks,
+            timestamp: event.timestamp
+          });
+        }
+        // error事件已由readNdjsonStream统一提示
+      }, values.fast, values.slow, values.signal);
     } catch (error) {
       console.error('选股失败:', error);
     } finally {
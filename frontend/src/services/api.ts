@@ -7,7 +7,10 @@ import {
   GenerateKlineResponse,
   AnalyzeStockResponse,
   BatchAnalyzeResponse,
-  ClearCacheResponse
+  BatchAnalysisItem,
+  ClearCacheResponse,
+  StockBasic,
+  StreamEvent
 } from '../types/APITypes';
 
 // 创建axios实例
@@ -80,6 +83,9 @@ export const selectStocks = async (
   return response.data;
 };
 
+// K线图地址（后端返回的图片地址经 /api 代理访问，浏览器按ETag缓存）
+export const klineImageSrc = (image_url: string): string => `/api${image_url}`;
+
 // 生成K线图
 export const generateKline = async (ts_code: string): Promise<GenerateKlineResponse> => {
   const response = await apiClient.get<GenerateKlineResponse>('/api/generate-kline', {
@@ -114,6 +120,73 @@ export const batchAnalyze = async (
   return response.data;
 };
 
+/**
+ * 读取NDJSON流式响应，每解析出一行事件即回调一次
+ * @param url 请求地址
+ * @param init fetch参数
+ * @param onEvent 事件回调
+ */
+const readNdjsonStream = async <T>(
+  url: string,
+  init: RequestInit,
+  onEvent: (event: StreamEvent<T>) => void
+): Promise<void> => {
+  const response = await fetch(url, init);
+  if (!response.ok || !response.body) {
+    const errMsg = `请求失败: ${response.status}`;
+    message.error(errMsg);
+    throw new Error(errMsg);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value, { stream: !done });
+    // 按换行切分，最后一段可能是不完整的行，留到下次处理
+    const lines = buffer.split('\n');
+    buffer = done ? '' : lines.pop() || '';
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const event = JSON.parse(line) as StreamEvent<T>;
+      if (event.type === 'error') {
+        message.error(event.error);
+      }
+      onEvent(event);
+    }
+    if (done) break;
+  }
+};
+
+// MACD选股（流式返回，每只股票到达即回调）
+export const selectStocksStream = async (
+  onEvent: (event: StreamEvent<StockBasic>) => void,
+  fast?: number,
+  slow?: number,
+  signal?: number
+): Promise<void> => {
+  const params = new URLSearchParams();
+  if (fast !== undefined) params.append('fast', String(fast));
+  if (slow !== undefined) params.append('slow', String(slow));
+  if (signal !== undefined) params.append('signal', String(signal));
+  await readNdjsonStream<StockBasic>(`/api/select-stocks/stream?${params.toString()}`, {}, onEvent);
+};
+
+// 批量分析（流式返回，每只股票分析完成即回调，按完成顺序到达）
+export const batchAnalyzeStream = async (
+  onEvent: (event: StreamEvent<BatchAnalysisItem>) => void,
+  fast?: number,
+  slow?: number,
+  signal?: number
+): Promise<void> => {
+  await readNdjsonStream<BatchAnalysisItem>('/api/batch-analyze/stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json;charset=utf-8' },
+    body: JSON.stringify({ fast, slow, signal, stream_format: 'ndjson' })
+  }, onEvent);
+};
+
 // 清理缓存
 export const clearCache = async (cache_type: string = "all"): Promise<ClearCacheResponse> => {
   const response = await apiClient.post<ClearCacheResponse>('/api/clear-cache', {
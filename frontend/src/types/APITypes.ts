@@ -21,7 +21,8 @@ export type UploadStatus = 'idle' | 'loading' | 'success' | 'error';
 export interface HealthCheckResponse {
   status: string;
   redis_connected: boolean;
-  chroma_count: number;
+  chroma_loaded: boolean;
+  chroma_count: number | null; // 向量库未初始化时为null
   llm_type: string;
   timestamp: string;
 }
@@ -51,7 +52,7 @@ export interface SelectStocksResponse {
 export interface GenerateKlineResponse {
   status: string;
   ts_code: string;
-  image_base64: string;
+  image_url: string; // K线图地址（如 /kline/sh.600000.png?date=20240614）
   timestamp: string;
 }
 
@@ -60,7 +61,7 @@ export interface AnalyzeStockResponse {
   status: string;
   ts_code: string;
   stock_name: string;
-  image_base64: string;
+  image_url: string;
   analysis_result: string;
   timestamp: string;
   llm_type: string;
@@ -73,7 +74,7 @@ export interface BatchAnalysisItem {
   industry: string;
   latest_price?: number;
   macd?: number;
-  image_base64: string;
+  image_url: string;
   analysis_result: string;
 }
 
@@ -91,4 +92,11 @@ export interface ClearCacheResponse {
   status: string;
   message: string;
   timestamp: string;
-}
\ No newline at end of file
+}
+
+// 流式响应事件（NDJSON每行一个事件：meta → item... → done，出错时为error）
+export type StreamEvent<T> =
+  | { type: 'meta'; count: number; total_selected?: number }
+  | { type: 'item'; index: number; data: T }
+  | { type: 'done'; count: number; timestamp: string }
+  | { type: 'error'; error: string };
@@ -0,0 +1,134 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from stock import stock_selector as selector_module  # noqa: E402
+from stock.bar_store import BarStore  # noqa: E402
+
+
+def make_bars(ts_code: str, days: int, seed: int, start: str = "2023-01-02") -> pd.DataFrame:
+    """生成随机游走日线"""
+    rng = np.random.default_rng(seed)
+    close = np.round(10 + np.cumsum(rng.normal(0, 0.2, days)), 2)
+    return pd.DataFrame({
+        "ts_code": ts_code,
+        "trade_date": pd.bdate_range(start, periods=days),
+        "open": close,
+        "high": close + 0.1,
+        "low": close - 0.1,
+        "close": close,
+        "vol": rng.integers(1_000_000, 5_000_000, days)
+    })
+
+
+def full_macd_tail(df: pd.DataFrame, params: tuple, tail: int = 2) -> dict:
+    """按pandas ewm全量重算最后tail根的MACD"""
+    fast, slow, signal = params
+    ema_fast = df["close"].ewm(span=fast, adjust=False).mean()
+    ema_slow = df["close"].ewm(span=slow, adjust=False).mean()
+    dif = ema_fast - ema_slow
+    dea = dif.ewm(span=signal, adjust=False).mean()
+    return {
+        "dif": dif.to_numpy()[-tail:],
+        "dea": dea.to_numpy()[-tail:],
+        "macd": (2 * (dif - dea)).to_numpy()[-tail:],
+        "close": df["close"].to_numpy()[-tail:]
+    }
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BarStore(str(tmp_path))
+    monkeypatch.setattr(selector_module, "bar_store", store)
+    return store
+
+
+@pytest.fixture
+def selector():
+    return selector_module.MACDStockSelector()
+
+
+def run_incremental(selector, store, codes, params):
+    metas = [store.read_meta(code) for code in codes]
+    return selector.calculate_macd_incremental(codes, metas, params=params)
+
+
+def assert_matches_full(codes, frames, params, result):
+    for col, code in enumerate(codes):
+        expected = full_macd_tail(frames[code], params)
+        for name in ("dif", "dea", "macd", "close"):
+            np.testing.assert_allclose(result[name][:, col], expected[name], rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize("params", [(12, 26, 9), (5, 35, 5)])
+def test_incremental_matches_full_recompute(selector, store, params):
+    codes = ["sh.600000", "sz.000001", "sz.300750"]
+    frames = {code: make_bars(code, 120 + 15 * i, seed=i) for i, code in enumerate(codes)}
+    for code in codes:
+        store.write(code, frames[code].iloc[:100])
+
+    # 首次全量计算并保存状态
+    first = run_incremental(selector, store, codes, params)
+    truncated = {code: frames[code].iloc[:100] for code in codes}
+    assert_matches_full(codes, truncated, params, first)
+
+    # 逐根、多根追加后只递推新增K线
+    for end in (101, 102, 110):
+        for code in codes:
+            store.append(code, frames[code].iloc[:end])
+        truncated = {code: frames[code].iloc[:end] for code in codes}
+        assert_matches_full(codes, truncated, params, run_incremental(selector, store, codes, params))
+
+    # 无新K线时直接使用状态中保存的最后两根
+    assert_matches_full(codes, truncated, params, run_incremental(selector, store, codes, params))
+
+    # 股票之间K线数量不同
+    for code in codes:
+        store.append(code, frames[code])
+    assert_matches_full(codes, frames, params, run_incremental(selector, store, codes, params))
+
+
+def test_rewritten_history_is_recomputed(selector, store):
+    params = selector.macd_params()
+    code = "sh.600000"
+    df = make_bars(code, 100, seed=1)
+    store.write(code, df)
+    run_incremental(selector, store, [code], params)
+
+    # 全量改写历史（如复权）后丢弃状态并重算
+    rewritten = df.assign(close=df["close"] * 1.1)
+    store.write(code, rewritten)
+    assert_matches_full([code], {code: rewritten}, params, run_incremental(selector, store, [code], params))
+
+
+def test_state_with_other_params_is_rejected(selector, store):
+    code = "sh.600000"
+    df = make_bars(code, 100, seed=2)
+    store.write(code, df.iloc[:90])
+    params = (12, 26, 9)
+    run_incremental(selector, store, [code], params)
+
+    # 状态文件中的参数与状态名不符时视为无效
+    state_name = selector.macd_state_name(params)
+    state = store.read_state(code, state_name)
+    store.write_state(code, state_name, {**state, "params": [5, 35, 5]})
+    meta = store.read_meta(code)
+    assert selector.load_macd_state(code, meta, params) is None
+
+    store.append(code, df)
+    assert_matches_full([code], {code: df}, params, run_incremental(selector, store, [code], params))
+
+
+def test_select_params_do_not_change_defaults(selector, store, monkeypatch):
+    monkeypatch.setattr(selector_module.redis_client, "get_frame", lambda *args, **kwargs: None)
+    monkeypatch.setattr(selector_module.redis_client, "set_frame", lambda *args, **kwargs: True)
+    monkeypatch.setattr(selector, "get_stock_list", lambda: [])
+    monkeypatch.setattr(selector, "prefetch_daily_data", lambda ts_codes: [])
+    defaults = selector.macd_params()
+    selector.select_stocks(5, 35, 5)
+    assert selector.macd_params() == defaults